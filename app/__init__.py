@@ -1,13 +1,59 @@
-from flask import Flask, g, request, render_template
+from flask import Flask, g, request, render_template, url_for, has_request_context
+from flask.json.provider import JSONProvider
+from werkzeug.http import http_date
+from datetime import date
+import decimal
+import json
+import os
 import time
+import orjson
 import signal
+from functools import lru_cache
 from contextlib import contextmanager
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from flask_caching import Cache
+from jinja2 import FileSystemBytecodeCache
 from config import Config
 
 db = SQLAlchemy()
 login_manager = LoginManager()
+cache = Cache()
+
+def _json_default(o):
+    """Types orjson leaves to us, encoded as Flask's default provider does"""
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, decimal.Decimal):
+        return str(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+class ORJSONProvider(JSONProvider):
+    """jsonify()/request.get_json() backed by orjson, keeping Flask's key order and type handling"""
+    # Dates still go through Flask's format (HTTP date strings) rather than orjson's ISO format
+    _options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(self, obj, **kwargs):
+        sort_keys = kwargs.pop('sort_keys', True)
+        default = kwargs.pop('default', _json_default)
+        indent = kwargs.pop('indent', None)
+        kwargs.pop('ensure_ascii', None)  # orjson always writes UTF-8
+        if kwargs or indent not in (None, 2):
+            # Options orjson has no equivalent for go through the stdlib encoder
+            return json.dumps(obj, sort_keys=sort_keys, default=default, indent=indent, **kwargs)
+        option = self._options
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return json.loads(s, **kwargs)
+        return orjson.loads(s)
 
 class TimeoutError(Exception):
     pass
@@ -137,6 +183,62 @@ def migrate_database():
         except Exception as e:
             print(f"⚠️ Could not update existing user settings: {e}")
         
+        # Migration 4: Add and backfill the materialized subscription.monthly_cost column
+        if inspector.has_table('subscription'):
+            subscription_columns = [col['name'] for col in inspector.get_columns('subscription')]
+            if 'monthly_cost' not in subscription_columns:
+                try:
+                    with db.engine.connect() as conn:
+                        conn.execute(text('ALTER TABLE subscription ADD COLUMN monthly_cost FLOAT'))
+                        conn.commit()
+                    migrations_applied.append("Added monthly_cost column to subscription")
+                except Exception as e:
+                    print(f"⚠️ Could not add monthly_cost column (may already exist): {e}")
+            try:
+                from sqlalchemy import update
+                from app.models import Subscription
+                with db.engine.connect() as conn:
+                    result = conn.execute(
+                        update(Subscription.__table__)
+                        .where(Subscription.__table__.c.monthly_cost.is_(None))
+                        .values(monthly_cost=Subscription.monthly_cost_expression())
+                    )
+                    conn.commit()
+                if result.rowcount:
+                    migrations_applied.append(f"Backfilled monthly_cost for {result.rowcount} subscriptions")
+            except Exception as e:
+                print(f"⚠️ Could not backfill subscription monthly_cost: {e}")
+        
+        # Migration 5: Add updated_at change stamps used for dashboard ETags
+        timestamp_type = 'TIMESTAMP' if db_dialect == 'postgresql' else 'DATETIME'
+        for table_name in ('subscription', 'payment_method'):
+            if not inspector.has_table(table_name):
+                continue
+            if 'updated_at' in [col['name'] for col in inspector.get_columns(table_name)]:
+                continue
+            try:
+                with db.engine.connect() as conn:
+                    conn.execute(text(f'ALTER TABLE {table_name} ADD COLUMN updated_at {timestamp_type}'))
+                    conn.commit()
+                migrations_applied.append(f"Added updated_at column to {table_name}")
+            except Exception as e:
+                print(f"⚠️ Could not add updated_at column to {table_name} (may already exist): {e}")
+        
+        # Migration 6: Create indexes declared on the models that existing tables are missing
+        # (db.create_all() only creates indexes together with new tables)
+        for table in db.metadata.sorted_tables:
+            if not table.indexes or not inspector.has_table(table.name):
+                continue
+            existing_indexes = {idx['name'] for idx in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing_indexes:
+                    continue
+                try:
+                    index.create(db.engine)
+                    migrations_applied.append(f"Created index {index.name} on {table.name}")
+                except Exception as e:
+                    print(f"⚠️ Could not create index {index.name} (may already exist): {e}")
+        
         if migrations_applied:
             print("🔄 Database migrations applied:")
             for migration in migrations_applied:
@@ -151,13 +253,45 @@ def migrate_database():
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
+    app.json = ORJSONProvider(app)
 
     db.init_app(app)
     login_manager.init_app(app)
-    login_manager.login_view = 'main.login'
+    cache.init_app(app)
+    login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Please log in to access this page.'
     login_manager.login_message_category = 'info'
 
+    # Template auto-reload stays tied to debug mode (Flask's default), so production never stat()s templates
+    bytecode_cache_dir = app.config.get('JINJA_BYTECODE_CACHE_DIR')
+    if bytecode_cache_dir != '':
+        try:
+            if bytecode_cache_dir:
+                os.makedirs(bytecode_cache_dir, mode=0o700, exist_ok=True)
+                app.jinja_env.bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir)
+            else:
+                # Jinja creates a 0700 directory per user and refuses one another user owns
+                app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+        except (OSError, RuntimeError) as e:
+            app.logger.warning(f"Template bytecode cache disabled: {e}")
+
+    # Templates build the same links on every render (and several per dashboard row); they only
+    # depend on the endpoint, its arguments and where the app is mounted, so build each one once.
+    # Blueprint-relative endpoints and absolute URLs depend on the current request and aren't cached.
+    @lru_cache(maxsize=4096)
+    def _cached_url_for(script_root, host, endpoint, values):
+        return url_for(endpoint, **dict(values))
+
+    def template_url_for(endpoint, **values):
+        if not has_request_context() or endpoint.startswith('.') or '_external' in values:
+            return url_for(endpoint, **values)
+        try:
+            return _cached_url_for(request.script_root, request.host, endpoint, tuple(sorted(values.items())))
+        except TypeError:  # unhashable argument
+            return url_for(endpoint, **values)
+
+    app.jinja_env.globals['url_for'] = template_url_for
+
     # Add custom Jinja2 filters for date formatting based on user preference
     @app.template_filter('user_date')
     def user_date_filter(date_obj):
@@ -277,7 +411,9 @@ def create_app():
                 'date_placeholder': 'DD/MM/YYYY'
             }
 
+    from app.auth import auth
     from app.routes import main
+    app.register_blueprint(auth)
     app.register_blueprint(main)
 
     with app.app_context():
@@ -317,7 +453,7 @@ def create_app():
                 default_user = User(username='admin', email='admin@example.com', is_admin=True)
                 default_user.set_password('changeme')
                 db.session.add(default_user)
-                db.session.commit()
+                db.session.flush()  # assigns default_user.id; user and settings commit together
                 
                 # Create default settings for admin user
                 admin_settings = UserSettings(user_id=default_user.id, date_format='eu')
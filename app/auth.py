@@ -0,0 +1,35 @@
+from flask import Blueprint, render_template, redirect, url_for, flash, request
+from urllib.parse import urlparse
+from flask_login import login_user, logout_user, login_required, current_user
+from app.models import User
+from app.forms import LoginForm
+
+auth = Blueprint('auth', __name__)
+
+@auth.route('/', methods=['GET', 'POST'])
+@auth.route('/login', methods=['GET', 'POST'])
+def login():
+    if current_user.is_authenticated:
+        return redirect(url_for('main.dashboard'))
+
+    form = LoginForm()
+    if form.validate_on_submit():
+        user = User.authenticate(form.username.data, form.password.data)
+        if user:
+            login_user(user)
+            next_page = request.args.get('next')
+            if next_page:
+                # Remove backslashes and validate that next_page is a relative URL
+                next_page_clean = next_page.replace('\\', '')
+                parsed = urlparse(next_page_clean)
+                if not parsed.netloc and not parsed.scheme:
+                    return redirect(next_page_clean)
+            return redirect(url_for('main.dashboard'))
+        flash('Invalid username or password', 'error')
+    return render_template('login.html', form=form)
+
+@auth.route('/logout')
+@login_required
+def logout():
+    logout_user()
+    return redirect(url_for('auth.login'))
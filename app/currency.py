@@ -1,11 +1,14 @@
 import requests
-import json
+import orjson
 import os
 import atexit
+import contextvars
+import threading
 from datetime import datetime, date, timezone
 from flask import current_app
 import xml.etree.ElementTree as ET
 from decimal import Decimal, getcontext, InvalidOperation
+from sqlalchemy.exc import SQLAlchemyError
 from apscheduler.schedulers.background import BackgroundScheduler
 
 # High precision for chained conversions
@@ -14,6 +17,39 @@ getcontext().prec = 28
 FLOATRATES_URL = "https://www.floatrates.com/daily/eur.json"
 ERAPI_URL = "https://open.er-api.com/v6/latest/EUR"
 
+CURRENCY_SYMBOLS = {
+    'USD': '$', 'EUR': '€', 'GBP': '£', 'JPY': '¥', 'CNY': '¥',
+    'CAD': 'C$', 'AUD': 'A$', 'CHF': 'CHF', 'INR': '₹',
+    'SEK': 'kr', 'NOK': 'kr', 'DKK': 'kr', 'PLN': 'zł',
+    'CZK': 'Kč', 'HUF': 'Ft', 'BGN': 'лв', 'RON': 'lei',
+    'HRK': 'kn', 'RUB': '₽', 'TRY': '₺', 'BRL': 'R$',
+    'MXN': '$', 'SGD': 'S$', 'HKD': 'HK$', 'KRW': '₩',
+    'ZAR': 'R', 'NZD': 'NZ$', 'THB': '฿', 'MYR': 'RM',
+    'PHP': '₱', 'IDR': 'Rp', 'VND': '₫'
+}
+
+# Supported rate providers, in the default fallback order
+PROVIDERS = ('frankfurter', 'floatrates', 'erapi_open')
+
+# Provider order for rate lookups made by the current request (or greenlet/thread);
+# None falls back to the CURRENCY_PROVIDER_PRIORITY environment default
+_provider_priority = contextvars.ContextVar('provider_priority', default=None)
+
+# Outcome of the current context's last rate lookup, so concurrent requests each
+# report the provider that actually served them
+_last_provider = contextvars.ContextVar('last_provider', default=None)
+_last_attempt_chain = contextvars.ContextVar('last_attempt_chain', default=())
+
+
+def _provider_order():
+    """Provider order for the current context, parsed from the environment when none was set"""
+    priority = _provider_priority.get()
+    if priority is None:
+        priority_env = os.getenv('CURRENCY_PROVIDER_PRIORITY', ','.join(PROVIDERS))
+        priority = [p.strip().lower() for p in priority_env.split(',') if p.strip()]
+        priority = ['floatrates' if p == 'jsdelivr' else p for p in priority]
+    return priority
+
 
 def ensure_timezone_aware(dt, default_tz=timezone.utc):
     """
@@ -29,10 +65,26 @@ class CurrencyConverter:
     """Currency converter with multi-provider fallback and provider-specific caching."""
 
     def __init__(self):
-        self.last_provider = None
-        self.last_attempt_chain = []  # list of (provider, status)
         self._circuit_breaker = {}  # Track failed providers
 
+    @property
+    def last_provider(self):
+        """Provider that served the current context's last rate lookup"""
+        return _last_provider.get()
+
+    @last_provider.setter
+    def last_provider(self, provider):
+        _last_provider.set(provider)
+
+    @property
+    def last_attempt_chain(self):
+        """(provider, status) pairs tried by the current context's last rate lookup"""
+        return _last_attempt_chain.get()
+
+    @last_attempt_chain.setter
+    def last_attempt_chain(self, chain):
+        _last_attempt_chain.set(chain)
+
     def _is_circuit_open(self, provider):
         """Check if circuit breaker is open for a provider"""
         if provider not in self._circuit_breaker:
@@ -60,14 +112,17 @@ class CurrencyConverter:
         if provider in self._circuit_breaker:
             del self._circuit_breaker[provider]
 
+    def set_priority(self, priority):
+        """Set the provider order for the current context; None restores the environment default"""
+        _provider_priority.set(list(priority) if priority else None)
+
     def get_exchange_rates(self, base_currency: str = 'EUR', force_refresh: bool = False):
+        from app import db
         from app.models import ExchangeRate
         self.last_attempt_chain = []
         base_currency = 'EUR'
         refresh_minutes = int(os.getenv('CURRENCY_REFRESH_MINUTES', '1440'))
-        provider_priority_env = os.getenv('CURRENCY_PROVIDER_PRIORITY', 'frankfurter,floatrates,erapi_open')
-        provider_priority = [p.strip().lower() for p in provider_priority_env.split(',') if p.strip()]
-        provider_priority = ['floatrates' if p == 'jsdelivr' else p for p in provider_priority]
+        provider_priority = _provider_order()
         primary_provider = provider_priority[0] if provider_priority else None
 
         if not force_refresh and primary_provider:
@@ -80,7 +135,7 @@ class CurrencyConverter:
                     try:
                         self.last_provider = primary_provider
                         self.last_attempt_chain.append((primary_provider, 'cache'))
-                        return json.loads(record.rates_json)
+                        return orjson.loads(record.rates_json)
                     except Exception:
                         pass
 
@@ -101,9 +156,13 @@ class CurrencyConverter:
                             try:
                                 self.last_provider = provider
                                 self.last_attempt_chain.append((provider, 'cache'))
-                                return json.loads(cached.rates_json)
+                                return orjson.loads(cached.rates_json)
                             except Exception:
                                 pass
+                if not force_refresh and rate_refresh_pending(current_app):
+                    # The queued refresh fetches this provider; serve stored rates meanwhile
+                    self.last_attempt_chain.append((provider, 'refresh-queued'))
+                    continue
                 if provider == 'frankfurter':
                     rates = self._fetch_frankfurter()
                 elif provider == 'floatrates':
@@ -112,23 +171,35 @@ class CurrencyConverter:
                     rates = self._fetch_erapi_open()
                 else:
                     continue
-                if rates and 'USD' in rates:
-                    self.last_provider = provider
-                    self._record_success(provider)  # Reset circuit breaker on success
-                    ExchangeRate.save_rates({k: str(v) for k, v in rates.items()}, base_currency, provider=provider)
-                    self.last_attempt_chain.append((provider, 'fetched'))
-                    return rates
+            except SQLAlchemyError as e:
+                # A database error says nothing about the provider, so it doesn't trip the circuit breaker
+                db.session.rollback()
+                current_app.logger.warning(f"Cached rate lookup for {provider} failed: {e}")
+                self.last_attempt_chain.append((provider, f'db-error:{e.__class__.__name__}'))
+                continue
             except Exception as e:
                 current_app.logger.warning(f"Provider {provider} failed: {e}")
                 self._record_failure(provider)  # Record failure for circuit breaker
                 self.last_attempt_chain.append((provider, f'failed:{e.__class__.__name__}'))
+                continue
+            if rates and 'USD' in rates:
+                self.last_provider = provider
+                self._record_success(provider)  # Reset circuit breaker on success
+                try:
+                    ExchangeRate.save_rates({k: str(v) for k, v in rates.items()}, base_currency, provider=provider)
+                except SQLAlchemyError as e:
+                    # The fetched rates still serve this request; the next lookup saves them again
+                    db.session.rollback()
+                    current_app.logger.warning(f"Could not store {provider} rates: {e}")
+                self.last_attempt_chain.append((provider, 'fetched'))
+                return rates
 
         fallback_cached = ExchangeRate.query.filter_by(date=date.today(), base_currency=base_currency).order_by(ExchangeRate.created_at.desc()).first()
         if fallback_cached:
             try:
                 self.last_provider = fallback_cached.provider
                 self.last_attempt_chain.append((fallback_cached.provider, 'fallback-cached'))
-                return json.loads(fallback_cached.rates_json)
+                return orjson.loads(fallback_cached.rates_json)
             except Exception:
                 pass
 
@@ -190,7 +261,7 @@ class CurrencyConverter:
         latest_rate = ExchangeRate.query.filter_by(base_currency=base_currency).order_by(ExchangeRate.date.desc()).first()
         if latest_rate:
             current_app.logger.info(f"Using fallback rates from {latest_rate.date}")
-            raw = json.loads(latest_rate.rates_json)
+            raw = orjson.loads(latest_rate.rates_json)
             # Convert any stored string/float to Decimal safely
             dec = {}
             for k, v in raw.items():
@@ -252,40 +323,47 @@ class CurrencyConverter:
         if not rates:
             return float(amount)
 
-        # Normalize all rates to Decimal
-        dec_rates = {}
-        for k, v in rates.items():
-            try:
-                if isinstance(v, Decimal):
-                    dec_rates[k] = v
-                else:
-                    dec_rates[k] = Decimal(str(v))
-            except (InvalidOperation, TypeError):
-                continue
-        if base_currency not in dec_rates:
-            dec_rates[base_currency] = Decimal('1')
         try:
             amount_dec = Decimal(str(amount))
         except (InvalidOperation, TypeError):
             return float(amount)
 
-        try:
-            # Normalize source amount into base currency first
-            if from_currency == base_currency:
-                amount_in_base = amount_dec
-            else:
-                if from_currency not in dec_rates or not dec_rates[from_currency]:
-                    return float(amount)
-                amount_in_base = amount_dec / dec_rates[from_currency]
-
-            # From base to target
-            if to_currency == base_currency:
-                return float(amount_in_base)
-            if to_currency not in dec_rates or not dec_rates[to_currency]:
-                return float(amount)
-            return float(amount_in_base * dec_rates[to_currency])
-        except (KeyError, ZeroDivisionError, TypeError):
+        factor = self.conversion_factor(from_currency, to_currency, rates, base_currency)
+        if factor is None:
             return float(amount)
+        return float(amount_dec * factor)
+
+    def conversion_factor(self, from_currency, to_currency, rates, base_currency='EUR'):
+        """Decimal multiplier turning from_currency amounts into to_currency, or None if a rate is missing.
+
+        Only the two rates involved are parsed, so callers converting many
+        amounts between the same pair can compute this once and reuse it.
+        """
+        def _rate(code):
+            value = rates.get(code)
+            if value is None or isinstance(value, Decimal):
+                return value
+            try:
+                return Decimal(str(value))
+            except (InvalidOperation, TypeError):
+                return None
+
+        factor = Decimal('1')
+        try:
+            # Source into base currency first, then base into target
+            if from_currency != base_currency:
+                from_rate = _rate(from_currency)
+                if not from_rate:
+                    return None
+                factor = factor / from_rate
+            if to_currency != base_currency:
+                to_rate = _rate(to_currency)
+                if not to_rate:
+                    return None
+                factor = factor * to_rate
+        except (ZeroDivisionError, TypeError, InvalidOperation):
+            return None
+        return factor
 
     def clear_today_cache(self, base_currency='EUR'):
         """Clear today's cached rates to force a refetch next call."""
@@ -297,6 +375,7 @@ class CurrencyConverter:
                 for rec in today_records:
                     db.session.delete(rec)
                 db.session.commit()
+                ExchangeRate.clear_rates_cache()
                 current_app.logger.info(f"Cleared today's exchange rate cache for base {base_currency} (all providers)")
                 return True
         except Exception as e:
@@ -342,28 +421,62 @@ class CurrencyConverter:
     
     def get_currency_symbol(self, currency_code):
         """Get currency symbol for display"""
-        currency_symbols = {
-            'USD': '$', 'EUR': '€', 'GBP': '£', 'JPY': '¥', 'CNY': '¥',
-            'CAD': 'C$', 'AUD': 'A$', 'CHF': 'CHF', 'INR': '₹',
-            'SEK': 'kr', 'NOK': 'kr', 'DKK': 'kr', 'PLN': 'zł',
-            'CZK': 'Kč', 'HUF': 'Ft', 'BGN': 'лв', 'RON': 'lei',
-            'HRK': 'kn', 'RUB': '₽', 'TRY': '₺', 'BRL': 'R$',
-            'MXN': '$', 'SGD': 'S$', 'HKD': 'HK$', 'KRW': '₩',
-            'ZAR': 'R', 'NZD': 'NZ$', 'THB': '฿', 'MYR': 'RM',
-            'PHP': '₱', 'IDR': 'Rp', 'VND': '₫'
-        }
-        return currency_symbols.get(currency_code, currency_code)
+        return CURRENCY_SYMBOLS.get(currency_code, currency_code)
 
 # Global converter instance
 currency_converter = CurrencyConverter()
 
 
-def refresh_exchange_rates(app, base_currency='EUR'):
+def refresh_exchange_rates(app, base_currency='EUR', priority=None):
     """Force a live refresh so background jobs keep cached rates warm."""
     with app.app_context():
+        # Scheduler threads are reused across jobs, so always set this job's order
+        currency_converter.set_priority(priority)
         return currency_converter.get_exchange_rates(base_currency, force_refresh=True)
 
 
+def rate_refresh_pending(app):
+    """Whether a queued one-off refresh hasn't finished yet"""
+    pending = getattr(app, '_currency_refresh_pending', None)
+    return pending is not None and pending.is_set()
+
+
+def _run_queued_refresh(app, base_currency, priority):
+    try:
+        return refresh_exchange_rates(app, base_currency, priority)
+    finally:
+        app._currency_refresh_pending.clear()
+
+
+def schedule_exchange_rate_refresh(app, base_currency='EUR'):
+    """Queue a one-off forced refresh on the currency refresh scheduler.
+
+    The job uses the provider order of the current request. Until it finishes,
+    rate lookups serve stored rates rather than fetching (and saving) the same
+    provider concurrently. Returns False when the scheduler isn't running, so
+    the caller can fetch synchronously instead.
+    """
+    scheduler = getattr(app, '_currency_refresh_scheduler', None)
+    if not scheduler:
+        return False
+    if getattr(app, '_currency_refresh_pending', None) is None:
+        app._currency_refresh_pending = threading.Event()
+    app._currency_refresh_pending.set()
+    try:
+        # No trigger: APScheduler runs the job once, right away, on its own thread
+        scheduler.add_job(
+            func=_run_queued_refresh,
+            args=(app, base_currency, _provider_priority.get()),
+            id='refresh_currency_rates_now',
+            replace_existing=True,
+            max_instances=1,
+        )
+    except Exception:
+        app._currency_refresh_pending.clear()
+        raise
+    return True
+
+
 def start_currency_refresh_scheduler(app):
     """Start a background job that periodically refreshes cached exchange rates."""
     if getattr(app, '_currency_refresh_scheduler', None):
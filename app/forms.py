@@ -1,10 +1,112 @@
+from functools import lru_cache
+import orjson
+from flask import g
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, FloatField, DateField, SelectField, IntegerField, TextAreaField, BooleanField, ValidationError
 from wtforms.validators import DataRequired, Optional, Email, EqualTo, Length, NumberRange
 from flask_login import current_user
+from app import db
 from app.models import User, PaymentMethod
 from app.currency import currency_converter
 
+CATEGORY_CHOICES = (
+    ('software', 'Software'),
+    ('hardware', 'Hardware'),
+    ('entertainment', 'Entertainment'),
+    ('utilities', 'Utilities'),
+    ('cloud_services', 'Cloud Services'),
+    ('news_media', 'News & Media'),
+    ('education', 'Education'),
+    ('insurance', 'Insurances'),
+    ('gaming', 'Gaming'),
+    ('other', 'Other'),
+)
+
+BILLING_CYCLE_CHOICES = (
+    ('daily', 'Daily'),
+    ('weekly', 'Weekly'),
+    ('bi-weekly', 'Bi-weekly (Every 2 weeks)'),
+    ('monthly', 'Monthly'),
+    ('bi-monthly', 'Bi-monthly (Every 2 months)'),
+    ('quarterly', 'Quarterly (Every 3 months)'),
+    ('semi-annually', 'Semi-annually (Every 6 months)'),
+    ('yearly', 'Yearly'),
+    ('custom', 'Custom'),
+)
+
+CUSTOM_PERIOD_CHOICES = (
+    ('days', 'Days'),
+    ('months', 'Months'),
+    ('years', 'Years'),
+)
+
+TIMEZONE_CHOICES = (
+    ('UTC', 'UTC'),
+    ('US/Eastern', 'Eastern Time'),
+    ('US/Central', 'Central Time'),
+    ('US/Mountain', 'Mountain Time'),
+    ('US/Pacific', 'Pacific Time'),
+    ('Europe/London', 'London'),
+    ('Europe/Paris', 'Paris'),
+    ('Europe/Berlin', 'Berlin'),
+    ('Europe/Amsterdam', 'Amsterdam'),
+    ('Asia/Tokyo', 'Tokyo'),
+    ('Asia/Shanghai', 'Shanghai'),
+)
+
+RATE_PROVIDER_CHOICES = (
+    ('frankfurter', 'Frankfurter (api.frankfurter.app)'),
+    ('floatrates', 'FloatRates (floatrates.com daily JSON)'),
+    ('erapi_open', 'ER API Open (open.er-api.com)'),
+)
+
+THEME_MODE_CHOICES = (('light', 'Light Mode'), ('dark', 'Dark Mode'))
+
+ACCENT_COLOR_CHOICES = (('blue', 'Blue'), ('purple', 'Purple'), ('green', 'Green'), ('red', 'Red'))
+
+DATE_FORMAT_CHOICES = (('eu', 'European (DD/MM/YYYY)'), ('us', 'US (MM/DD/YYYY)'))
+
+PAYMENT_TYPE_CHOICES = (
+    ('credit_card', 'Credit Card'),
+    ('debit_card', 'Debit Card'),
+    ('bank_account', 'Bank Account'),
+    ('paypal', 'PayPal'),
+    ('apple_pay', 'Apple Pay'),
+    ('google_pay', 'Google Pay'),
+    ('other', 'Other'),
+)
+
+WEBHOOK_TYPE_CHOICES = (
+    ('gotify', 'Gotify'),
+    ('teams', 'Microsoft Teams'),
+    ('discord', 'Discord'),
+    ('slack', 'Slack'),
+    ('generic', 'Generic JSON'),
+)
+
+HOUR_CHOICES = tuple((i, f'{i:02d}:00') for i in range(24))
+
+_URL_SCHEMES = ('http://', 'https://')
+
+
+@lru_cache(maxsize=1)
+def _currency_choices():
+    """Supported currency choices, built once and shared by every form instance"""
+    return tuple(currency_converter.get_supported_currencies())
+
+
+def _user_payment_methods():
+    """(id, name) rows for the current user's payment methods, cached for the request"""
+    if not hasattr(g, '_pm_cache'):
+        g._pm_cache = [
+            tuple(row) for row in
+            db.session.query(PaymentMethod.id, PaymentMethod.name)
+            .filter_by(user_id=current_user.id)
+            .all()
+        ]
+    return g._pm_cache
+
+
 class LoginForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired()])
     password = PasswordField('Password', validators=[DataRequired()])
@@ -13,36 +115,11 @@ class LoginForm(FlaskForm):
 class SubscriptionForm(FlaskForm):
     name = StringField('Subscription Name', validators=[DataRequired()])
     company = StringField('Company', validators=[DataRequired()])
-    category = SelectField('Category', 
-                          choices=[('software', 'Software'), 
-                                 ('hardware', 'Hardware'),
-                                 ('entertainment', 'Entertainment'),
-                                 ('utilities', 'Utilities'),
-                                 ('cloud_services', 'Cloud Services'),
-                                 ('news_media', 'News & Media'),
-                                 ('education', 'Education'),
-                                 ('insurance', 'Insurances'),
-                                 ('gaming', 'Gaming'),
-                                 ('other', 'Other')],
-                          validators=[Optional()])
+    category = SelectField('Category', choices=CATEGORY_CHOICES, validators=[Optional()])
     cost = FloatField('Cost', validators=[DataRequired(), NumberRange(min=0)])
     currency = SelectField('Currency', validators=[DataRequired()])
-    billing_cycle = SelectField('Billing Cycle', 
-                               choices=[('daily', 'Daily'),
-                                      ('weekly', 'Weekly'),
-                                      ('bi-weekly', 'Bi-weekly (Every 2 weeks)'),
-                                      ('monthly', 'Monthly'), 
-                                      ('bi-monthly', 'Bi-monthly (Every 2 months)'),
-                                      ('quarterly', 'Quarterly (Every 3 months)'),
-                                      ('semi-annually', 'Semi-annually (Every 6 months)'),
-                                      ('yearly', 'Yearly'), 
-                                      ('custom', 'Custom')],
-                               validators=[DataRequired()])
-    custom_period_type = SelectField('Custom Period Type',
-                                   choices=[('days', 'Days'),
-                                          ('months', 'Months'),
-                                          ('years', 'Years')],
-                                   validators=[Optional()])
+    billing_cycle = SelectField('Billing Cycle', choices=BILLING_CYCLE_CHOICES, validators=[DataRequired()])
+    custom_period_type = SelectField('Custom Period Type', choices=CUSTOM_PERIOD_CHOICES, validators=[Optional()])
     custom_period_value = IntegerField('Custom Period Value', validators=[Optional(), NumberRange(min=1)])
     payment_method_id = SelectField('Payment Method', coerce=int, validators=[Optional()])
     start_date = DateField('Start Date', validators=[DataRequired()])
@@ -56,12 +133,11 @@ class SubscriptionForm(FlaskForm):
         super(SubscriptionForm, self).__init__(*args, **kwargs)
         
         # Set currency choices
-        self.currency.choices = currency_converter.get_supported_currencies()
+        self.currency.choices = _currency_choices()
         
         # Set payment method choices
         if current_user.is_authenticated:
-            payment_methods = PaymentMethod.query.filter_by(user_id=current_user.id).all()
-            self.payment_method_id.choices = [(0, 'Select Payment Method')] + [(pm.id, pm.name) for pm in payment_methods]
+            self.payment_method_id.choices = [(0, 'Select Payment Method')] + _user_payment_methods()
         else:
             self.payment_method_id.choices = [(0, 'Select Payment Method')]
 
@@ -74,14 +150,12 @@ class UserSettingsForm(FlaskForm):
     
     def validate_username(self, username):
         if username.data != current_user.username:
-            user = User.query.filter_by(username=username.data).first()
-            if user:
+            if db.session.query(User.query.filter_by(username=username.data).exists()).scalar():
                 raise ValidationError('Username already exists. Please choose a different one.')
     
     def validate_email(self, email):
         if email.data != current_user.email:
-            user = User.query.filter_by(email=email.data).first()
-            if user:
+            if db.session.query(User.query.filter_by(email=email.data).exists()).scalar():
                 raise ValidationError('Email already registered. Please choose a different one.')
 
 class NotificationSettingsForm(FlaskForm):
@@ -90,51 +164,26 @@ class NotificationSettingsForm(FlaskForm):
     notification_days = IntegerField('Days before expiry to send notification', 
                                    validators=[DataRequired(), NumberRange(min=1, max=365)])
     notification_time = SelectField('Daily notification time', 
-                                  choices=[(i, f'{i:02d}:00') for i in range(24)],
+                                  choices=HOUR_CHOICES,
                                   coerce=int,
                                   validators=[DataRequired()])
 
 class GeneralSettingsForm(FlaskForm):
     currency = SelectField('Preferred Display Currency', validators=[DataRequired()])
-    timezone = SelectField('Timezone',
-                          choices=[('UTC', 'UTC'), ('US/Eastern', 'Eastern Time'), 
-                                 ('US/Central', 'Central Time'), ('US/Mountain', 'Mountain Time'),
-                                 ('US/Pacific', 'Pacific Time'), ('Europe/London', 'London'),
-                                 ('Europe/Paris', 'Paris'), ('Europe/Berlin', 'Berlin'),
-                                 ('Europe/Amsterdam', 'Amsterdam'), ('Asia/Tokyo', 'Tokyo'), 
-                                 ('Asia/Shanghai', 'Shanghai')],
-                          validators=[DataRequired()])
-    preferred_rate_provider = SelectField('Exchange Rate Provider', choices=[
-    ('frankfurter','Frankfurter (api.frankfurter.app)'),
-    ('floatrates','FloatRates (floatrates.com daily JSON)'),
-    ('erapi_open','ER API Open (open.er-api.com)')
-    ], validators=[Optional()])
-    theme_mode = SelectField('Theme Mode', 
-                           choices=[('light', 'Light Mode'), ('dark', 'Dark Mode')], 
-                           validators=[DataRequired()])
-    accent_color = SelectField('Accent Color',
-                             choices=[('blue', 'Blue'), ('purple', 'Purple'), ('green', 'Green'), ('red', 'Red')],
-                             validators=[DataRequired()])
-    date_format = SelectField('Date Format',
-                            choices=[('eu', 'European (DD/MM/YYYY)'), ('us', 'US (MM/DD/YYYY)')],
-                            validators=[DataRequired()])
+    timezone = SelectField('Timezone', choices=TIMEZONE_CHOICES, validators=[DataRequired()])
+    preferred_rate_provider = SelectField('Exchange Rate Provider', choices=RATE_PROVIDER_CHOICES, validators=[Optional()])
+    theme_mode = SelectField('Theme Mode', choices=THEME_MODE_CHOICES, validators=[DataRequired()])
+    accent_color = SelectField('Accent Color', choices=ACCENT_COLOR_CHOICES, validators=[DataRequired()])
+    date_format = SelectField('Date Format', choices=DATE_FORMAT_CHOICES, validators=[DataRequired()])
     
     def __init__(self, *args, **kwargs):
         super(GeneralSettingsForm, self).__init__(*args, **kwargs)
-        self.currency.choices = currency_converter.get_supported_currencies()
+        self.currency.choices = _currency_choices()
     # Preselect provider if settings exist on the object
 
 class PaymentMethodForm(FlaskForm):
     name = StringField('Payment Method Name', validators=[DataRequired(), Length(min=1, max=100)])
-    payment_type = SelectField('Type', 
-                      choices=[('credit_card', 'Credit Card'),
-                             ('debit_card', 'Debit Card'),
-                             ('bank_account', 'Bank Account'),
-                             ('paypal', 'PayPal'),
-                             ('apple_pay', 'Apple Pay'),
-                             ('google_pay', 'Google Pay'),
-                             ('other', 'Other')],
-                      validators=[DataRequired()])
+    payment_type = SelectField('Type', choices=PAYMENT_TYPE_CHOICES, validators=[DataRequired()])
     last_four = StringField('Last 4 Digits (optional)', validators=[Optional(), Length(max=4)])
     notes = TextAreaField('Notes', validators=[Optional()])
 
@@ -152,13 +201,7 @@ class AdminEditUserForm(FlaskForm):
 
 class WebhookForm(FlaskForm):
     name = StringField('Webhook Name', validators=[DataRequired(), Length(min=1, max=100)])
-    webhook_type = SelectField('Webhook Type', 
-                              choices=[('gotify', 'Gotify'),
-                                     ('teams', 'Microsoft Teams'),
-                                     ('discord', 'Discord'),
-                                     ('slack', 'Slack'),
-                                     ('generic', 'Generic JSON')],
-                              validators=[DataRequired()])
+    webhook_type = SelectField('Webhook Type', choices=WEBHOOK_TYPE_CHOICES, validators=[DataRequired()])
     url = StringField('Webhook URL', validators=[DataRequired(), Length(min=1, max=500)])
     auth_header = StringField('API Key/Token (optional)', validators=[Optional(), Length(max=200)])
     auth_username = StringField('Username (for Basic Auth)', validators=[Optional(), Length(max=100)])
@@ -170,13 +213,12 @@ class WebhookForm(FlaskForm):
     def validate_custom_headers(self, field):
         if field.data:
             try:
-                import json
-                json.loads(field.data)
+                orjson.loads(field.data)
             except ValueError:
                 raise ValidationError('Custom headers must be valid JSON format')
     
     def validate_url(self, field):
-        if not (field.data.startswith('http://') or field.data.startswith('https://')):
+        if not field.data.startswith(_URL_SCHEMES):
             raise ValidationError('URL must start with http:// or https://')
         
         # Enhanced validation using webhook module
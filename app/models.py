@@ -1,7 +1,27 @@
-from datetime import datetime, date, timezone
+import base64
+import calendar
+import threading
+import time
+from datetime import datetime, date, timedelta, timezone
+from functools import lru_cache
+from decimal import Decimal
+import orjson
+from sqlalchemy import and_, case, event, func, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import object_session
+from flask import g, has_app_context
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
-from app import db, login_manager
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+from app import db, login_manager, cache
+
+# argon2-cffi hashes in C; the defaults follow the RFC 9106 low-memory profile
+_password_hasher = PasswordHasher()
+
+@lru_cache(maxsize=1)
+def _dummy_password_hash():
+    return _password_hasher.hash('not-a-real-password')
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -12,18 +32,60 @@ class User(UserMixin, db.Model):
     subscriptions = db.relationship('Subscription', backref='user', lazy=True, cascade='all, delete-orphan')
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = _password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        if not self.password_hash:
+            return False
+        if not self.password_hash.startswith('$argon2'):
+            # Accounts created before the switch still carry werkzeug hashes
+            return check_password_hash(self.password_hash, password)
+        try:
+            return _password_hasher.verify(self.password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+
+    @classmethod
+    def authenticate(cls, username, password):
+        """Return the user for these credentials, or None.
+
+        Unknown usernames still pay for one hash verification, so response
+        timing doesn't reveal which usernames exist.
+        """
+        user = cls.query.filter_by(username=username).first()
+        if user is None:
+            try:
+                _password_hasher.verify(_dummy_password_hash(), password)
+            except (VerificationError, InvalidHashError):
+                pass
+            return None
+        if not user.check_password(password):
+            return None
+        if user.password_needs_rehash():
+            # Upgrade legacy werkzeug hashes (or outdated argon2 parameters) while the plain password is at hand
+            user.set_password(password)
+            try:
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+        return user
+
+    def password_needs_rehash(self):
+        if not self.password_hash or not self.password_hash.startswith('$argon2'):
+            return True
+        try:
+            return _password_hasher.check_needs_rehash(self.password_hash)
+        except InvalidHashError:
+            return True
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # settings is joined-loaded on User, so this is the only query for the current user
+    return db.session.get(User, int(user_id))
 
 class UserSettings(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     
     # Notification settings
     email_notifications = db.Column(db.Boolean, default=True)
@@ -46,11 +108,37 @@ class UserSettings(db.Model):
     date_format = db.Column(db.String(10), default='eu')  # 'eu' (DD/MM/YYYY) or 'us' (MM/DD/YYYY)
     
     # Relationship
-    user = db.relationship('User', backref=db.backref('settings', uselist=False, cascade='all, delete-orphan'))
+    # Settings are read on nearly every request, so load them together with the user
+    user = db.relationship('User', backref=db.backref('settings', uselist=False, lazy='joined',
+                                                      cascade='all, delete-orphan'))
 
     def __repr__(self):
         return f'<UserSettings {self.user_id}>'
 
+class _DefaultSettings:
+    """Read-only stand-in for users without a settings row.
+
+    An unsaved UserSettings() only gets its column defaults on INSERT, so its
+    attributes read as None; this carries the declared defaults instead and
+    skips building an instrumented model instance on every request. One
+    instance is shared by every such user, so it refuses writes; updates go
+    through a real UserSettings row.
+    """
+    __slots__ = tuple(column.key for column in UserSettings.__table__.columns)
+
+    def __init__(self):
+        for column in UserSettings.__table__.columns:
+            default = column.default
+            object.__setattr__(self, column.key, default.arg if default is not None and default.is_scalar else None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"DEFAULT_SETTINGS is shared by all users and read-only; can't set {name!r}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"DEFAULT_SETTINGS is shared by all users and read-only; can't delete {name!r}")
+
+DEFAULT_SETTINGS = _DefaultSettings()
+
 class Webhook(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -78,8 +166,7 @@ class Webhook(db.Model):
         # Add custom headers if any
         if self.custom_headers:
             try:
-                import json
-                custom = json.loads(self.custom_headers)
+                custom = orjson.loads(self.custom_headers)
                 headers.update(custom)
             except (ValueError, TypeError):
                 pass
@@ -94,7 +181,6 @@ class Webhook(db.Model):
             else:
                 headers['Authorization'] = f'Bearer {self.auth_header}'
         elif self.auth_username and self.auth_password:
-            import base64
             credentials = base64.b64encode(f'{self.auth_username}:{self.auth_password}'.encode()).decode()
             headers['Authorization'] = f'Basic {credentials}'
         
@@ -110,42 +196,78 @@ class ExchangeRate(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint('date', 'base_currency', 'provider', name='uq_rate_date_base_provider'),
+        # Newest row per provider (general settings' "last updated") without sorting the history
+        db.Index('ix_rate_latest', 'base_currency', 'provider', 'created_at'),
     )
     
     def __repr__(self):
         return f'<ExchangeRate {self.date} base:{self.base_currency} provider:{self.provider}>'
     
+    # Parsed rates per (date, base_currency, provider); rows only change through save_rates.
+    # Request threads and the scheduler share it, so writes and pruning hold the lock
+    _rates_cache = {}
+    _rates_cache_lock = threading.Lock()
+
     @classmethod
     def get_latest_rates(cls, base_currency='EUR', provider=None):
-        """Get the latest exchange rates for today for a specific provider (if given)."""
+        """Get today's exchange rates as Decimals for a specific provider (if given)."""
         today = date.today()
+        key = (today, base_currency, provider)
+        rates = cls._rates_cache.get(key)
+        if rates is not None:
+            return rates
         query = cls.query.filter_by(date=today, base_currency=base_currency)
         if provider:
             query = query.filter_by(provider=provider)
         rate_record = query.first()
-        if rate_record:
-            import json
-            return json.loads(rate_record.rates_json)
-        return None
+        if not rate_record:
+            return None
+        rates = {k: Decimal(str(v)) for k, v in orjson.loads(rate_record.rates_json).items()}
+        with cls._rates_cache_lock:
+            # Drop entries from previous days so the cache doesn't grow over time
+            for stale_key in [k for k in cls._rates_cache if k[0] != today]:
+                cls._rates_cache.pop(stale_key, None)
+            cls._rates_cache[key] = rates
+        return rates
     
     @classmethod
     def save_rates(cls, rates, base_currency='EUR', provider='unknown'):
-        """Save exchange rates for today for the given provider. Upsert semantics."""
-        import json
+        """Save exchange rates for today for the given provider. Upsert semantics.
+
+        A request and the refresh job can both save the same provider's rates;
+        when the other one inserts the row first, roll back and update that row.
+        """
         today = date.today()
-        existing_rate = cls.query.filter_by(date=today, base_currency=base_currency, provider=provider).first()
-        if existing_rate:
-            existing_rate.rates_json = json.dumps(rates)
-            existing_rate.created_at = datetime.now(timezone.utc)
-        else:
-            new_rate = cls(
-                date=today,
-                base_currency=base_currency,
-                provider=provider,
-                rates_json=json.dumps(rates)
-            )
-            db.session.add(new_rate)
-        db.session.commit()
+        rates_json = orjson.dumps(rates).decode()
+        for attempt in range(2):
+            existing_rate = cls.query.filter_by(date=today, base_currency=base_currency, provider=provider).first()
+            if existing_rate:
+                existing_rate.rates_json = rates_json
+                existing_rate.created_at = datetime.now(timezone.utc)
+            else:
+                new_rate = cls(
+                    date=today,
+                    base_currency=base_currency,
+                    provider=provider,
+                    rates_json=rates_json
+                )
+                db.session.add(new_rate)
+            try:
+                db.session.commit()
+                break
+            except IntegrityError:
+                db.session.rollback()
+                if attempt:
+                    raise
+        with cls._rates_cache_lock:
+            cls._rates_cache.pop((today, base_currency, provider), None)
+            cls._rates_cache.pop((today, base_currency, None), None)
+
+    @classmethod
+    def clear_rates_cache(cls):
+        """Forget all parsed rates, e.g. after rate rows were deleted"""
+        with cls._rates_cache_lock:
+            cls._rates_cache.clear()
 
 class PaymentMethod(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -155,13 +277,130 @@ class PaymentMethod(db.Model):
     notes = db.Column(db.Text, nullable=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc),
+                           onupdate=lambda: datetime.now(timezone.utc))
     
     # Relationship back to user
     user = db.relationship('User', backref=db.backref('payment_methods', lazy=True))
+
+    __table_args__ = (
+        db.Index('ix_pm_user', 'user_id'),
+    )
     
     def __repr__(self):
         return f'<PaymentMethod {self.name}>'
 
+# Factor converting a cost per billing cycle into a monthly cost
+_MONTHLY_MULT = {
+    'daily': 30.0,
+    'weekly': 4.33,  # Average weeks per month
+    'bi-weekly': 2.17,  # Every 2 weeks
+    'monthly': 1.0,
+    'bi-monthly': 1 / 2,  # Every 2 months
+    'quarterly': 1 / 3,  # Every 3 months
+    'semi-annually': 1 / 6,  # Every 6 months
+    'yearly': 1 / 12,
+}
+
+# Monthly factor for one unit of a custom billing period
+_CUSTOM_PERIOD_MULT = {
+    'days': 30.44,  # Average days per month
+    'months': 1.0,
+    'years': 1 / 12,
+}
+
+def _monthly_cost_for(cost, billing_cycle, custom_period_type, custom_period_value, custom_days):
+    """Normalise a cost charged once per billing cycle to a monthly amount"""
+    multiplier = _MONTHLY_MULT.get(billing_cycle)
+    if multiplier is not None:
+        return cost * multiplier
+    if billing_cycle == 'custom':
+        if custom_period_value and custom_period_type:
+            multiplier = _CUSTOM_PERIOD_MULT.get(custom_period_type)
+            if multiplier is not None:
+                return (cost / custom_period_value) * multiplier
+        elif custom_days:  # Fallback for backward compatibility
+            return (cost / custom_days) * 30.44  # Average days per month
+    return 0
+
+def _convert_with_rates(amount, from_currency, target_currency, exchange_rates):
+    """Convert amount with caller-supplied EUR based rates; unknown currencies are left unconverted"""
+    # Same currency (the common case) needs no rate lookups at all
+    if not target_currency or target_currency == from_currency or not exchange_rates:
+        return amount
+    base_currency = 'EUR'
+    if from_currency not in exchange_rates or target_currency not in exchange_rates:
+        return amount
+    # Convert source -> base
+    if from_currency == base_currency:
+        amount_in_base = amount
+    else:
+        amount_in_base = amount / exchange_rates[from_currency]
+    # Base -> target
+    if target_currency == base_currency:
+        return amount_in_base
+    return amount_in_base * exchange_rates[target_currency]
+
+def _today():
+    """Today's date, computed once per app context so every row in a request agrees"""
+    if not has_app_context():
+        return date.today()
+    if not hasattr(g, '_today'):
+        g._today = date.today()
+    return g._today
+
+def _request_eur_rates():
+    """EUR based rates for the current request, loaded once and kept on flask.g"""
+    from app.currency import currency_converter
+
+    if not hasattr(g, '_eur_rates_cache'):
+        # Prefer today's stored rates so rendering never waits on a provider API
+        cached_rates = None
+        try:
+            cached_rates = ExchangeRate.get_latest_rates('EUR')
+        except Exception:
+            pass
+
+        if cached_rates:
+            g._eur_rates_cache = cached_rates
+        else:
+            try:
+                g._eur_rates_cache = currency_converter.get_exchange_rates('EUR') or {}
+            except Exception:
+                # If all else fails, use fallback rates
+                g._eur_rates_cache = currency_converter._get_fallback_rates('EUR') or {}
+    return g._eur_rates_cache
+
+def _convert_from_eur_rates(amount, from_currency, target_currency):
+    """Convert amount with the request's EUR rates, falling back when no request context exists"""
+    from app.currency import currency_converter
+
+    from_currency = from_currency or 'EUR'
+    try:
+        rates = _request_eur_rates()
+    except Exception:
+        # Outside a request (e.g. scheduler jobs) or rate lookup failed
+        try:
+            rates = currency_converter.get_exchange_rates('EUR') or {}
+        except Exception:
+            rates = currency_converter._get_fallback_rates('EUR') or {}
+        return currency_converter.convert_amount(amount, from_currency, target_currency,
+                                                 rates=rates, base_currency='EUR')
+
+    if amount is None:
+        return 0.0
+    if from_currency == target_currency or not rates:
+        return float(amount)
+    # One conversion factor per currency pair and request, instead of re-reading rates per row
+    factors = g.setdefault('_fx_factors', {})
+    key = (from_currency, target_currency)
+    if key not in factors:
+        factors[key] = currency_converter.conversion_factor(from_currency, target_currency, rates, 'EUR')
+    factor = factors[key]
+    if factor is None:
+        return float(amount)
+    return float(Decimal(str(amount)) * factor)
+
 class Subscription(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -181,57 +420,94 @@ class Subscription(db.Model):
     notes = db.Column(db.Text)
     is_active = db.Column(db.Boolean, default=True)
     custom_notification_days = db.Column(db.Integer)  # Override default notification days for this subscription
+    # Cost normalised to one month in the subscription's own currency, kept in sync on every flush
+    monthly_cost = db.Column(db.Float)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc),
+                           onupdate=lambda: datetime.now(timezone.utc))
     
     # Relationships
     payment_method = db.relationship('PaymentMethod', backref='subscriptions')
 
+    __table_args__ = (
+        # Dashboard and notification queries filter on user, active flag and expiry date
+        db.Index('ix_sub_user_active_end', 'user_id', 'is_active', 'end_date'),
+        # Dashboard category filter and the "all"/"expiring" views ordered by expiry date
+        db.Index('ix_sub_user_cat', 'user_id', 'category'),
+        db.Index('ix_sub_user_end', 'user_id', 'end_date'),
+        # Payment method deletion checks whether any subscription still uses it
+        db.Index('ix_sub_payment_method', 'payment_method_id'),
+        # Partial index covering only active rows, the dashboard's default view
+        # (MySQL has no partial indexes and builds a plain user_id index instead)
+        db.Index('ix_sub_active_user', 'user_id',
+                 postgresql_where=is_active == True,
+                 sqlite_where=is_active == True),
+    )
+
     def get_monthly_cost(self, target_currency=None, exchange_rates=None):
         """Calculate monthly cost based on billing cycle, optionally converted to target currency"""
-        monthly_cost = 0
-        
-        if self.billing_cycle == 'daily':
-            monthly_cost = self.cost * 30
-        elif self.billing_cycle == 'weekly':
-            monthly_cost = self.cost * 4.33  # Average weeks per month
-        elif self.billing_cycle == 'bi-weekly':
-            monthly_cost = self.cost * 2.17  # Every 2 weeks
-        elif self.billing_cycle == 'monthly':
-            monthly_cost = self.cost
-        elif self.billing_cycle == 'bi-monthly':
-            monthly_cost = self.cost / 2  # Every 2 months
-        elif self.billing_cycle == 'quarterly':
-            monthly_cost = self.cost / 3  # Every 3 months
-        elif self.billing_cycle == 'semi-annually':
-            monthly_cost = self.cost / 6  # Every 6 months
-        elif self.billing_cycle == 'yearly':
-            monthly_cost = self.cost / 12
-        elif self.billing_cycle == 'custom':
-            if self.custom_period_value and self.custom_period_type:
-                if self.custom_period_type == 'days':
-                    monthly_cost = (self.cost / self.custom_period_value) * 30.44  # Average days per month
-                elif self.custom_period_type == 'months':
-                    monthly_cost = self.cost / self.custom_period_value
-                elif self.custom_period_type == 'years':
-                    monthly_cost = self.cost / (self.custom_period_value * 12)
-            elif self.custom_days:  # Fallback for backward compatibility
-                monthly_cost = (self.cost / self.custom_days) * 30.44  # Average days per month
-        
-        # Convert currency if needed (assumes exchange_rates are based on EUR)
-        if target_currency and target_currency != self.currency and exchange_rates:
-            base_currency = 'EUR'
-            if self.currency in exchange_rates and target_currency in exchange_rates:
-                # Convert source -> base
-                if self.currency == base_currency:
-                    amount_in_base = monthly_cost
-                else:
-                    amount_in_base = monthly_cost / exchange_rates[self.currency]
-                # Base -> target
-                if target_currency == base_currency:
-                    monthly_cost = amount_in_base
-                else:
-                    monthly_cost = amount_in_base * exchange_rates[target_currency]
-        
-        return monthly_cost
+        monthly_cost = _monthly_cost_for(self.cost, self.billing_cycle, self.custom_period_type,
+                                         self.custom_period_value, self.custom_days)
+        return _convert_with_rates(monthly_cost, self.currency, target_currency, exchange_rates)
+
+    @classmethod
+    def monthly_cost_expression(cls):
+        """SQL counterpart of _monthly_cost_for, so the database can aggregate monthly costs"""
+        custom = cls.billing_cycle == 'custom'
+        has_period = and_(cls.custom_period_value != 0, cls.custom_period_type != '')
+        no_period = or_(cls.custom_period_value.is_(None), cls.custom_period_value == 0,
+                        cls.custom_period_type.is_(None), cls.custom_period_type == '')
+        return case(
+            *[(cls.billing_cycle == cycle, cls.cost * multiplier) for cycle, multiplier in _MONTHLY_MULT.items()],
+            *[(and_(custom, has_period, cls.custom_period_type == period),
+                cls.cost / cls.custom_period_value * multiplier)
+              for period, multiplier in _CUSTOM_PERIOD_MULT.items()],
+            (and_(custom, no_period, cls.custom_days != 0),
+             cls.cost / cls.custom_days * 30.44),
+            else_=0.0,
+        )
+
+    @classmethod
+    def monthly_total_window(cls):
+        """Window column carrying, on every row, the active monthly total for that row's currency.
+
+        Adding it to a list query returns the per-currency totals in the same
+        round-trip as the rows, so callers convert each currency total once.
+        """
+        monthly = func.coalesce(cls.monthly_cost, cls.monthly_cost_expression())
+        active_cost = case((cls.is_active.is_(True), monthly), else_=0.0)
+        return func.sum(active_cost).over(partition_by=cls.currency)
+
+    @classmethod
+    def categories_for(cls, user_id):
+        """Distinct non-empty categories used by a user's subscriptions, cached until one of their rows changes"""
+        key = f'categories:{user_cache_namespace(user_id)}'
+        categories = cache.get(key)
+        if categories is None:
+            rows = db.session.query(cls.category).filter_by(user_id=user_id).distinct().all()
+            categories = [row[0] for row in rows if row[0]]
+            cache.set(key, categories)
+        return categories
+
+    @classmethod
+    def monthly_cost_totals(cls, query, *group_by):
+        """Monthly cost sums of the rows matched by query, grouped by group_by columns and currency.
+
+        Returns (*group_values, currency, total) rows, ordered by each group's
+        first subscription so results keep the order the rows were added in.
+        """
+        monthly = func.coalesce(cls.monthly_cost, cls.monthly_cost_expression())
+        return (query.order_by(None)
+                .with_entities(*group_by, cls.currency, func.sum(monthly))
+                .group_by(*group_by, cls.currency)
+                .order_by(func.min(cls.id))
+                .all())
+
+    @staticmethod
+    def convert_total(amount, from_currency, target_currency):
+        """Convert an aggregated amount with the same rates the per-row *_in_currency helpers use"""
+        if not target_currency or target_currency == from_currency:
+            return amount
+        return _convert_from_eur_rates(amount, from_currency, target_currency)
 
     def get_yearly_cost(self, target_currency=None, exchange_rates=None):
         """Calculate yearly cost"""
@@ -239,38 +515,22 @@ class Subscription(db.Model):
 
     def get_cost_in_currency(self, target_currency=None, exchange_rates=None):
         """Get the raw cost converted to target currency"""
-        cost = self.cost
-        
-        if target_currency and target_currency != self.currency and exchange_rates:
-            base_currency = 'EUR'
-            if self.currency in exchange_rates and target_currency in exchange_rates:
-                if self.currency == base_currency:
-                    amount_in_base = cost
-                else:
-                    amount_in_base = cost / exchange_rates[self.currency]
-                if target_currency == base_currency:
-                    cost = amount_in_base
-                else:
-                    cost = amount_in_base * exchange_rates[target_currency]
-        
-        return cost
+        return _convert_with_rates(self.cost, self.currency, target_currency, exchange_rates)
 
     def is_expiring_soon(self, days_ahead=7):
         """Check if subscription is expiring within specified days"""
         if not self.end_date:
             return False
         
-        from datetime import datetime, timedelta
-        check_date = datetime.now().date() + timedelta(days=days_ahead)
-        return self.end_date <= check_date and self.end_date >= datetime.now().date()
+        today = _today()
+        return today <= self.end_date <= today + timedelta(days=days_ahead)
 
     def days_until_expiry(self):
         """Get days until expiry"""
         if not self.end_date:
             return None
         
-        from datetime import datetime
-        delta = self.end_date - datetime.now().date()
+        delta = self.end_date - _today()
         return delta.days if delta.days >= 0 else 0
 
     def get_next_billing_date(self, today=None):
@@ -279,9 +539,6 @@ class Subscription(db.Model):
         Returns the next date when the subscription will charge/renew.
         If the subscription has already ended, returns None.
         """
-        from datetime import datetime, timedelta, date
-        import calendar
-
         def _clamped_date(year, month, day):
             max_day = calendar.monthrange(year, month)[1]
             return date(year, month, min(day, max_day))
@@ -401,135 +658,67 @@ class Subscription(db.Model):
         return days if days is not None else 7
 
     def get_monthly_cost_in_currency(self, target_currency):
-        """Get monthly cost converted to target currency using currency converter with timeout protection"""
-        from app.currency import currency_converter
-        
+        """Get monthly cost converted to target currency using the request's cached rates"""
         if not target_currency or target_currency == self.currency:
             return self.get_monthly_cost()
-        
-        # Use cached rates to avoid API calls during subscription operations
-        try:
-            from flask import g
-            if not hasattr(g, '_eur_rates_cache'):
-                # Try to get from cache first, only fetch if absolutely necessary
-                cached_rates = None
-                try:
-                    from app.models import ExchangeRate
-                    from datetime import date
-                    latest = ExchangeRate.query.filter_by(date=date.today(), base_currency='EUR').first()
-                    if latest:
-                        import json
-                        cached_rates = json.loads(latest.rates_json)
-                except Exception:
-                    pass
-                
-                if cached_rates:
-                    from decimal import Decimal
-                    g._eur_rates_cache = {k: Decimal(str(v)) for k, v in cached_rates.items()}
-                else:
-                    # Fallback - fetch rates but with timeout protection
-                    try:
-                        g._eur_rates_cache = currency_converter.get_exchange_rates('EUR') or {}
-                    except Exception:
-                        # If all else fails, use fallback rates
-                        g._eur_rates_cache = currency_converter._get_fallback_rates('EUR') or {}
-            rates = g._eur_rates_cache
-        except Exception:
-            # Final fallback - use static conversion or return original cost
-            try:
-                rates = currency_converter.get_exchange_rates('EUR') or {}
-            except Exception:
-                rates = currency_converter._get_fallback_rates('EUR') or {}
-        
-        base_currency = 'EUR'
-        monthly_cost_source = self.get_monthly_cost()
-        return currency_converter.convert_amount(monthly_cost_source, self.currency or base_currency, target_currency, rates=rates, base_currency=base_currency)
+        return _convert_from_eur_rates(self.get_monthly_cost(), self.currency, target_currency)
     
     def get_yearly_cost_in_currency(self, target_currency):
-        """Get yearly cost converted to target currency using currency converter with timeout protection"""
-        from app.currency import currency_converter
-        
+        """Get yearly cost converted to target currency using the request's cached rates"""
         if not target_currency or target_currency == self.currency:
             return self.get_yearly_cost()
-        
-        # Use same caching strategy as monthly cost
-        try:
-            from flask import g
-            if not hasattr(g, '_eur_rates_cache'):
-                # Try to get from cache first, only fetch if absolutely necessary
-                cached_rates = None
-                try:
-                    from app.models import ExchangeRate
-                    from datetime import date
-                    latest = ExchangeRate.query.filter_by(date=date.today(), base_currency='EUR').first()
-                    if latest:
-                        import json
-                        cached_rates = json.loads(latest.rates_json)
-                except Exception:
-                    pass
-                
-                if cached_rates:
-                    from decimal import Decimal
-                    g._eur_rates_cache = {k: Decimal(str(v)) for k, v in cached_rates.items()}
-                else:
-                    # Fallback - fetch rates but with timeout protection
-                    try:
-                        g._eur_rates_cache = currency_converter.get_exchange_rates('EUR') or {}
-                    except Exception:
-                        # If all else fails, use fallback rates
-                        g._eur_rates_cache = currency_converter._get_fallback_rates('EUR') or {}
-            rates = g._eur_rates_cache
-        except Exception:
-            # Final fallback - use static conversion or return original cost
-            try:
-                rates = currency_converter.get_exchange_rates('EUR') or {}
-            except Exception:
-                rates = currency_converter._get_fallback_rates('EUR') or {}
-        
-        base_currency = 'EUR'
-        yearly_cost_source = self.get_yearly_cost()
-        return currency_converter.convert_amount(yearly_cost_source, self.currency or base_currency, target_currency, rates=rates, base_currency=base_currency)
+        return _convert_from_eur_rates(self.get_yearly_cost(), self.currency, target_currency)
 
     def get_raw_cost_in_currency(self, target_currency):
-        """Get raw cost converted to target currency using currency converter with timeout protection"""
-        from app.currency import currency_converter
-        
+        """Get raw cost converted to target currency using the request's cached rates"""
         if not target_currency or target_currency == self.currency:
             return self.cost
-        
-        # Use same caching strategy as monthly cost
-        try:
-            from flask import g
-            if not hasattr(g, '_eur_rates_cache'):
-                # Try to get from cache first, only fetch if absolutely necessary
-                cached_rates = None
-                try:
-                    from app.models import ExchangeRate
-                    from datetime import date
-                    latest = ExchangeRate.query.filter_by(date=date.today(), base_currency='EUR').first()
-                    if latest:
-                        import json
-                        cached_rates = json.loads(latest.rates_json)
-                except Exception:
-                    pass
-                
-                if cached_rates:
-                    from decimal import Decimal
-                    g._eur_rates_cache = {k: Decimal(str(v)) for k, v in cached_rates.items()}
-                else:
-                    # Fallback - fetch rates but with timeout protection
-                    try:
-                        g._eur_rates_cache = currency_converter.get_exchange_rates('EUR') or {}
-                    except Exception:
-                        # If all else fails, use fallback rates
-                        g._eur_rates_cache = currency_converter._get_fallback_rates('EUR') or {}
-            rates = g._eur_rates_cache
-        except Exception:
-            # Final fallback - use static conversion or return original cost
-            try:
-                rates = currency_converter.get_exchange_rates('EUR') or {}
-            except Exception:
-                rates = currency_converter._get_fallback_rates('EUR') or {}
-        
-        base_currency = 'EUR'
-        return currency_converter.convert_amount(self.cost, self.currency or base_currency, target_currency, rates=rates, base_currency=base_currency)
+        return _convert_from_eur_rates(self.cost, self.currency, target_currency)
+
+
+def user_cache_namespace(user_id):
+    """Cache key prefix for values derived from user_id's data"""
+    key = f'user-data-version:{user_id}'
+    version = cache.get(key)
+    if version is None:
+        # Not set yet, or evicted: seed a fresh version rather than fall back to an older namespace.
+        # add() keeps a version another request stored first, so read back whichever won
+        cache.add(key, time.time_ns(), timeout=0)
+        version = cache.get(key)
+    return f"user:{user_id}:{version}"
+
+def invalidate_user_cache(user_id):
+    """Move user_id to a fresh cache namespace so every cached value of theirs is recomputed"""
+    if user_id is not None and has_app_context():
+        cache.set(f'user-data-version:{user_id}', time.time_ns(), timeout=0)
+
+@event.listens_for(Subscription, 'after_insert')
+@event.listens_for(Subscription, 'after_update')
+@event.listens_for(Subscription, 'after_delete')
+@event.listens_for(PaymentMethod, 'after_insert')
+@event.listens_for(PaymentMethod, 'after_update')
+@event.listens_for(PaymentMethod, 'after_delete')
+@event.listens_for(UserSettings, 'after_insert')
+@event.listens_for(UserSettings, 'after_update')
+@event.listens_for(UserSettings, 'after_delete')
+def _invalidate_user_cache(mapper, connection, target):
+    # Flushed rows aren't committed yet; bump the namespace once they are, so a concurrent
+    # request can't cache uncommitted data under it and a rollback doesn't bump it at all
+    session = object_session(target)
+    if session is not None and target.user_id is not None:
+        session.info.setdefault('changed_user_ids', set()).add(target.user_id)
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_committed_user_caches(session):
+    for user_id in session.info.pop('changed_user_ids', ()):
+        invalidate_user_cache(user_id)
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_rolled_back_user_changes(session):
+    session.info.pop('changed_user_ids', None)
+
+@event.listens_for(Subscription, 'before_insert')
+@event.listens_for(Subscription, 'before_update')
+def _store_monthly_cost(mapper, connection, target):
+    target.monthly_cost = _monthly_cost_for(target.cost, target.billing_cycle, target.custom_period_type,
+                                            target.custom_period_value, target.custom_days)
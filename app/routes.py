@@ -1,28 +1,136 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, send_from_directory, current_app
-from urllib.parse import urlparse
-from flask_login import login_user, logout_user, login_required, current_user
-from sqlalchemy import text
-from app import db
-from app.models import User, Subscription, UserSettings, PaymentMethod, ExchangeRate, Webhook
-from app.forms import (LoginForm, SubscriptionForm, UserSettingsForm, 
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, send_from_directory, current_app, session, make_response, g
+from flask_login import current_user
+from sqlalchemy import text, select, func, case, bindparam
+from sqlalchemy.orm import joinedload, selectinload, raiseload
+from app import db, cache, login_manager
+from app.models import (User, Subscription, UserSettings, PaymentMethod, ExchangeRate, Webhook, DEFAULT_SETTINGS,
+                        user_cache_namespace)
+from app.forms import (SubscriptionForm, UserSettingsForm, 
                       NotificationSettingsForm, GeneralSettingsForm, PaymentMethodForm,
                       AdminUserForm, AdminEditUserForm, WebhookForm)
-from app.currency import currency_converter
+from app.currency import currency_converter, rate_refresh_pending, schedule_exchange_rate_refresh, PROVIDERS
 from datetime import datetime, timedelta, date
+import hashlib
+import math
 import os
 
 main = Blueprint('main', __name__)
 
+def _owned_or_404(model, id):
+    """Load one of the current user's rows by id; other users' rows 404 just like missing ones"""
+    return model.query.filter_by(id=id, user_id=current_user.id).first_or_404()
+
+def aggregate_costs(query, display_currency, group_by):
+    """Monthly cost per group_by value, converted to display_currency.
+
+    The database sums each (group, currency) pair, so only one conversion per
+    pair runs in Python instead of one per subscription.
+    """
+    amounts = {}
+    for key, currency, amount in Subscription.monthly_cost_totals(query, group_by):
+        converted = Subscription.convert_total(float(amount or 0), currency, display_currency)
+        amounts.setdefault(key, []).append(converted)
+    # fsum avoids the rounding drift of adding many fractional float amounts
+    return {key: math.fsum(values) for key, values in amounts.items()}
+
+def _cached_for_user(name, compute, *key_parts):
+    """compute() cached per user and key_parts; saving any of the user's rows drops the entry"""
+    key = f'{name}:{user_cache_namespace(current_user.id)}:{key_parts!r}'
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value)
+    return value
+
+def _user_data_etag(user_settings, *extra):
+    """ETag for a page built from the current user's data; changes whenever any of it could.
+
+    Covers the user's subscriptions and payment methods (count and newest
+    change), today's exchange rates, the user's settings, the date, the
+    full request path including filters and any extra values the view
+    depends on.
+    """
+    user_id = current_user.id
+    stamp = db.session.execute(select(
+        select(func.count(Subscription.id)).where(Subscription.user_id == user_id).scalar_subquery(),
+        select(func.max(Subscription.updated_at)).where(Subscription.user_id == user_id).scalar_subquery(),
+        select(func.count(PaymentMethod.id)).where(PaymentMethod.user_id == user_id).scalar_subquery(),
+        select(func.max(PaymentMethod.updated_at)).where(PaymentMethod.user_id == user_id).scalar_subquery(),
+        select(func.max(ExchangeRate.created_at)).where(ExchangeRate.date == date.today()).scalar_subquery(),
+    )).one()
+    settings = [getattr(user_settings, column.key) for column in UserSettings.__table__.columns]
+    parts = (user_id, current_user.username, current_user.is_admin, tuple(stamp), settings,
+             date.today(), request.full_path) + extra
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+def _revalidate_with_etag(response, etag):
+    """Mark a per-user response as cacheable only after revalidating against etag"""
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def _not_modified(etag):
+    return _revalidate_with_etag(current_app.response_class(status=304), etag)
+
+
+# Base statement for the dashboard list, built once; the view only appends filters and ordering.
+# The table shows each subscription's payment method, so it is loaded in the same query, and each
+# row also carries its currency's monthly total, so no separate aggregate query is needed. Any other
+# relationship access raises instead of quietly issuing one lazy load per row.
+_DASHBOARD_SUBSCRIPTIONS = (select(Subscription, Subscription.monthly_total_window())
+                            .where(Subscription.user_id == bindparam('user_id'))
+                            .options(joinedload(Subscription.payment_method), raiseload('*')))
+
+
+def _ensure_settings():
+    """The current user's settings row for updating, added to the session if they have none yet"""
+    settings = current_user.settings
+    if settings is None:
+        settings = UserSettings(user_id=current_user.id)
+        db.session.add(settings)
+        current_user.settings = settings
+    return settings
+
+def _apply_provider_pref(settings):
+    """Put the user's preferred rate provider first for this request's rate lookups"""
+    preferred = settings.preferred_rate_provider if settings else None
+    if preferred:
+        currency_converter.set_priority([preferred] + [p for p in PROVIDERS if p != preferred])
+    else:
+        # Don't inherit the previous request's order on a reused thread/greenlet
+        currency_converter.set_priority(None)
+
+# Endpoints that work without signing in; every other view on this blueprint requires a login
+_PUBLIC_ENDPOINTS = {'main.health_check', 'main.favicon'}
+
+@main.before_request
+def require_login():
+    """Send anonymous users to the login page, then resolve the user's settings once per request"""
+    if not current_user.is_authenticated:
+        _apply_provider_pref(None)
+        if request.endpoint in _PUBLIC_ENDPOINTS:
+            return None
+        return login_manager.unauthorized()
+    g.settings = current_user.settings or DEFAULT_SETTINGS
+    _apply_provider_pref(g.settings)
+
+_HEALTH_PING = text('SELECT 1')
+
 @main.route('/health')
 def health_check():
     """Health check endpoint for monitoring"""
     try:
         # Check database connectivity
-        db.session.execute(text('SELECT 1'))
+        db.session.execute(_HEALTH_PING)
         
-        # Check if currency converter is working
-        from app.currency import currency_converter
-        rates_available = bool(currency_converter._get_fallback_rates('EUR'))
+        # Check if currency converter is working. Fallback rates (stored history or the built-in
+        # table) don't disappear once available, so probes after the first success skip loading
+        # them; a failed check is retried on the next probe.
+        rates_available = getattr(current_app, '_health_rates_available', False)
+        if not rates_available:
+            rates_available = bool(currency_converter._get_fallback_rates('EUR'))
+            current_app._health_rates_available = rates_available
         
         return jsonify({
             'status': 'healthy',
@@ -40,40 +148,11 @@ def health_check():
 
 @main.route('/favicon.ico')
 def favicon():
-    """Serve favicon directly"""
+    """Serve favicon directly; browsers may keep it for 30 days instead of re-requesting it per page"""
     return send_from_directory(os.path.join(main.root_path, '..', 'static', 'assets', 'img'),
-                               'icon_main.ico', mimetype='image/x-icon')
-
-@main.route('/', methods=['GET', 'POST'])
-@main.route('/login', methods=['GET', 'POST'])
-def login():
-    if current_user.is_authenticated:
-        return redirect(url_for('main.dashboard'))
-
-    form = LoginForm()
-    if form.validate_on_submit():
-        user = User.query.filter_by(username=form.username.data).first()
-        if user and user.check_password(form.password.data):
-            login_user(user)
-            next_page = request.args.get('next')
-            if next_page:
-                # Remove backslashes and validate that next_page is a relative URL
-                next_page_clean = next_page.replace('\\', '')
-                parsed = urlparse(next_page_clean)
-                if not parsed.netloc and not parsed.scheme:
-                    return redirect(next_page_clean)
-            return redirect(url_for('main.dashboard'))
-        flash('Invalid username or password', 'error')
-    return render_template('login.html', form=form)
-
-@main.route('/logout')
-@login_required
-def logout():
-    logout_user()
-    return redirect(url_for('main.login'))
+                               'icon_main.ico', mimetype='image/x-icon', max_age=30 * 24 * 3600)
 
 @main.route('/sync-theme', methods=['POST'])
-@login_required
 def sync_theme():
     """Sync theme preferences from localStorage to user settings"""
     data = request.get_json()
@@ -90,19 +169,14 @@ def sync_theme():
         accent_color = 'purple'
     
     # Update user settings
-    if not current_user.settings:
-        settings = UserSettings(user_id=current_user.id)
-        db.session.add(settings)
-        current_user.settings = settings
-    
-    current_user.settings.theme_mode = theme_mode
-    current_user.settings.accent_color = accent_color
+    settings = _ensure_settings()
+    settings.theme_mode = theme_mode
+    settings.accent_color = accent_color
     db.session.commit()
     
     return jsonify({'success': True})
 
 @main.route('/dashboard')
-@login_required
 def dashboard():
     # Get filter parameters
     category_filter = request.args.get('category', 'all')
@@ -110,23 +184,32 @@ def dashboard():
     sort_by = request.args.get('sort', 'end_date')  # Default sort by end_date (nearest expiry first)
     sort_order = request.args.get('order', 'asc')  # Default ascending order (nearest first)
     
-    query = Subscription.query.filter_by(user_id=current_user.id)
+    query = _DASHBOARD_SUBSCRIPTIONS
 
-    user_settings_for_today = current_user.settings or UserSettings()
+    user_settings_for_today = g.settings
     try:
         from zoneinfo import ZoneInfo
         today_for_billing = datetime.now(ZoneInfo(user_settings_for_today.timezone or 'UTC')).date()
     except Exception:
         today_for_billing = datetime.now().date()
 
+    # Serve 304 when nothing shown on the dashboard changed; pages carrying flash messages are never cached
+    etag = None
+    if not session.get('_flashes'):
+        etag = _user_data_etag(user_settings_for_today, today_for_billing)
+        if etag in request.if_none_match:
+            return _not_modified(etag)
+
     if category_filter != 'all':
-        query = query.filter_by(category=category_filter)
+        query = query.where(Subscription.category == category_filter)
+    # '= true' rather than IS TRUE: SQLite only uses the ix_sub_active_user partial index
+    # when the query repeats the index's predicate as written
     if status_filter == 'active':
-        query = query.filter_by(is_active=True)
+        query = query.where(Subscription.is_active == True)
     elif status_filter == 'inactive':
-        query = query.filter_by(is_active=False)
+        query = query.where(Subscription.is_active == False)
     elif status_filter == 'expiring':
-        user_settings = current_user.settings or UserSettings()
+        user_settings = g.settings
         days_ahead = user_settings.notification_days
         check_date = datetime.now().date() + timedelta(days=days_ahead)
         query = query.filter(
@@ -157,12 +240,14 @@ def dashboard():
         else:
             query = query.order_by(Subscription.start_date.asc())
     elif sort_by == 'end_date':
+        # Infinite (NULL) subscriptions come last in both directions. Ordering on IS NULL works on
+        # every backend, unlike NULLS FIRST/LAST (unsupported by MySQL).
         if sort_order == 'desc':
-            # For descending: furthest dates first, then infinite (NULL) last
-            query = query.order_by(Subscription.end_date.desc().nulls_last(), Subscription.name.asc())
+            query = query.order_by(Subscription.end_date.is_(None), Subscription.end_date.desc(),
+                                   Subscription.name.asc())
         else:
-            # For ascending: nearest dates first, then infinite (NULL) last
-            query = query.order_by(Subscription.end_date.asc().nulls_last(), Subscription.name.asc())
+            query = query.order_by(Subscription.end_date.is_(None), Subscription.end_date.asc(),
+                                   Subscription.name.asc())
     elif sort_by == 'category':
         if sort_order == 'desc':
             # Handle nulls: null categories should appear last
@@ -173,23 +258,20 @@ def dashboard():
         # Default fallback to name sorting
         query = query.order_by(Subscription.name.asc())
     
-    subscriptions = query.all()
+    rows = db.session.execute(query, {'user_id': current_user.id}).all()
+    subscriptions = [sub for sub, _ in rows]
+    monthly_by_currency = {sub.currency: float(total or 0) for sub, total in rows}
     
     # Handle sorting by monthly cost (calculated field)
     if sort_by == 'monthly_cost':
-        user_settings = current_user.settings or UserSettings()
+        user_settings = g.settings
         display_currency = request.args.get('currency', user_settings.currency)
         
-        # Apply preferred provider priority for currency conversion
-        if user_settings.preferred_rate_provider:
-            defaults = ['frankfurter','floatrates','erapi_open']
-            priority = [user_settings.preferred_rate_provider] + [p for p in defaults if p != user_settings.preferred_rate_provider]
-            os.environ['CURRENCY_PROVIDER_PRIORITY'] = ','.join(priority)
-        
         try:
-            # Sort by monthly cost in display currency
+            # Sort by monthly cost in display currency, from the stored monthly_cost column
+            # and the request's cached conversion factor for each currency
             subscriptions.sort(
-                key=lambda x: x.get_monthly_cost_in_currency(display_currency),
+                key=lambda x: Subscription.convert_total(x.monthly_cost or 0.0, x.currency, display_currency),
                 reverse=(sort_order == 'desc')
             )
         except Exception as e:
@@ -197,20 +279,6 @@ def dashboard():
             # Fall back to cost sorting if monthly cost calculation fails
             subscriptions.sort(key=lambda x: x.cost, reverse=(sort_order == 'desc'))
     
-    # Handle post-processing sorting for end_date to ensure infinite subscriptions are always last
-    if sort_by == 'end_date':
-        def end_date_sort_key(subscription):
-            if subscription.end_date is None:
-                # For infinite subscriptions, use a far future date for sorting
-                from datetime import date
-                return date(9999, 12, 31)
-            return subscription.end_date
-        
-        subscriptions.sort(
-            key=end_date_sort_key,
-            reverse=(sort_order == 'desc')
-        )
-
     # Handle sorting by next billing date (calculated field)
     if sort_by == 'next_billing_date':
         def next_billing_sort_key(subscription):
@@ -218,7 +286,6 @@ def dashboard():
             if next_date is None:
                 # For subscriptions that won't bill again (ended), use a far future date for ascending
                 # or a past date for descending so they appear last or first respectively
-                from datetime import date
                 return date(9999, 12, 31) if sort_order == 'asc' else date(1900, 1, 1)
             return next_date
         
@@ -227,18 +294,11 @@ def dashboard():
             reverse=(sort_order == 'desc')
         )
 
-    user_settings = current_user.settings or UserSettings()
+    user_settings = g.settings
     display_currency = request.args.get('currency', user_settings.currency)
     
-    # Apply preferred provider priority early (before any rate fetch inside subscription helpers)
-    if user_settings.preferred_rate_provider:
-        defaults = ['frankfurter','floatrates','erapi_open']
-        priority = [user_settings.preferred_rate_provider] + [p for p in defaults if p != user_settings.preferred_rate_provider]
-        os.environ['CURRENCY_PROVIDER_PRIORITY'] = ','.join(priority)
-    
     # Pre-fetch exchange rates once to avoid multiple API calls during cost calculations
     try:
-        from flask import g
         if not hasattr(g, '_eur_rates_cache'):
             g._eur_rates_cache = currency_converter.get_exchange_rates('EUR') or {}
     except Exception as e:
@@ -247,21 +307,32 @@ def dashboard():
     
     # Calculate totals with better error handling
     try:
-        total_monthly = sum(sub.get_monthly_cost_in_currency(display_currency) for sub in subscriptions if sub.is_active)
-        total_yearly = sum(sub.get_yearly_cost_in_currency(display_currency) for sub in subscriptions if sub.is_active)
+        rates = getattr(g, '_eur_rates_cache', None)
+        total_monthly = math.fsum(
+            currency_converter.convert_amount(amount, currency or 'EUR', display_currency, rates=rates)
+            for currency, amount in monthly_by_currency.items()
+        )
+        total_yearly = total_monthly * 12
     except Exception as e:
         current_app.logger.error(f"Error calculating costs: {e}")
         total_monthly = 0
         total_yearly = 0
         flash('Exchange rates temporarily unavailable. Costs may not be accurate.', 'warning')
     
-    categories = db.session.query(Subscription.category.distinct()).filter_by(user_id=current_user.id).all()
-    categories = [cat[0] for cat in categories if cat[0]]
-    expiring_soon = [sub for sub in subscriptions if sub.is_expiring_soon(user_settings.notification_days)]
+    categories = Subscription.categories_for(current_user.id)
+    # Same window as Subscription.is_expiring_soon, with the bounds computed once
+    expiry_start = date.today()
+    expiry_cutoff = expiry_start + timedelta(days=user_settings.notification_days)
+    expiring_soon = [sub for sub in subscriptions
+                     if sub.end_date and expiry_start <= sub.end_date <= expiry_cutoff]
     currency_symbol = currency_converter.get_currency_symbol(display_currency)
     active_provider = currency_converter.last_provider
     
-    return render_template('dashboard.html', 
+    # A flash raised while rendering (e.g. rate failures) must not be cached either
+    if session.get('_flashes'):
+        etag = None
+
+    response = make_response(render_template('dashboard.html', 
                          subscriptions=subscriptions,
                          total_monthly=total_monthly,
                          total_yearly=total_yearly,
@@ -275,10 +346,12 @@ def dashboard():
                          currency_symbol=currency_symbol,
                          rate_provider=active_provider,
                          requested_provider=user_settings.preferred_rate_provider,
-                         today_for_billing=today_for_billing)
+                         today_for_billing=today_for_billing))
+    if etag:
+        _revalidate_with_etag(response, etag)
+    return response
 
 @main.route('/add_subscription', methods=['GET', 'POST'])
-@login_required
 def add_subscription():
     form = SubscriptionForm()
     if form.validate_on_submit():
@@ -312,12 +385,8 @@ def add_subscription():
     return render_template('add_subscription.html', form=form)
 
 @main.route('/edit_subscription/<int:id>', methods=['GET', 'POST'])
-@login_required
 def edit_subscription(id):
-    subscription = Subscription.query.get_or_404(id)
-    if subscription.user_id != current_user.id:
-        flash('Unauthorized access', 'error')
-        return redirect(url_for('main.dashboard'))
+    subscription = _owned_or_404(Subscription, id)
     form = SubscriptionForm(obj=subscription)
     if form.validate_on_submit():
         try:
@@ -346,12 +415,8 @@ def edit_subscription(id):
     return render_template('edit_subscription.html', form=form, subscription=subscription)
 
 @main.route('/toggle_subscription/<int:id>')
-@login_required
 def toggle_subscription(id):
-    subscription = Subscription.query.get_or_404(id)
-    if subscription.user_id != current_user.id:
-        flash('Unauthorized access', 'error')
-        return redirect(url_for('main.dashboard'))
+    subscription = _owned_or_404(Subscription, id)
     subscription.is_active = not subscription.is_active
     db.session.commit()
     status = 'activated' if subscription.is_active else 'deactivated'
@@ -359,19 +424,14 @@ def toggle_subscription(id):
     return redirect(url_for('main.dashboard'))
 
 @main.route('/delete_subscription/<int:id>')
-@login_required
 def delete_subscription(id):
-    subscription = Subscription.query.get_or_404(id)
-    if subscription.user_id != current_user.id:
-        flash('Unauthorized access', 'error')
-        return redirect(url_for('main.dashboard'))
+    subscription = _owned_or_404(Subscription, id)
     db.session.delete(subscription)
     db.session.commit()
     flash('Subscription deleted successfully!', 'success')
     return redirect(url_for('main.dashboard'))
 
 @main.route('/user_settings', methods=['GET', 'POST'])
-@login_required
 def user_settings():
     form = UserSettingsForm(obj=current_user)
     if form.validate_on_submit():
@@ -390,16 +450,11 @@ def user_settings():
     return render_template('user_settings.html', form=form)
 
 @main.route('/notification_settings', methods=['GET', 'POST'])
-@login_required
 def notification_settings():
-    settings = current_user.settings or UserSettings(user_id=current_user.id)
+    settings = g.settings
     form = NotificationSettingsForm(obj=settings)
     if form.validate_on_submit():
-        if not current_user.settings:
-            settings = UserSettings(user_id=current_user.id)
-            db.session.add(settings)
-        else:
-            settings = current_user.settings
+        settings = _ensure_settings()
         settings.email_notifications = form.email_notifications.data
         settings.webhook_notifications = form.webhook_notifications.data
         settings.notification_days = form.notification_days.data
@@ -410,7 +465,6 @@ def notification_settings():
     return render_template('notification_settings.html', form=form)
 
 @main.route('/test_email', methods=['POST'])
-@login_required
 def test_email():
     """Send a test email to verify email configuration"""
     from app.email import send_test_email
@@ -432,7 +486,6 @@ def test_email():
     return redirect(url_for('main.notification_settings'))
 
 @main.route('/add_webhook', methods=['GET', 'POST'])
-@login_required
 def add_webhook():
     """Add a new webhook configuration"""
     form = WebhookForm()
@@ -455,10 +508,9 @@ def add_webhook():
     return render_template('add_webhook.html', form=form)
 
 @main.route('/edit_webhook/<int:id>', methods=['GET', 'POST'])
-@login_required
 def edit_webhook(id):
     """Edit an existing webhook configuration"""
-    webhook = Webhook.query.filter_by(id=id, user_id=current_user.id).first_or_404()
+    webhook = _owned_or_404(Webhook, id)
     form = WebhookForm(obj=webhook)
     
     # Don't populate sensitive fields on GET
@@ -488,10 +540,9 @@ def edit_webhook(id):
     return render_template('edit_webhook.html', form=form, webhook=webhook)
 
 @main.route('/delete_webhook/<int:id>', methods=['POST'])
-@login_required
 def delete_webhook(id):
     """Delete a webhook configuration"""
-    webhook = Webhook.query.filter_by(id=id, user_id=current_user.id).first_or_404()
+    webhook = _owned_or_404(Webhook, id)
     webhook_name = webhook.name
     db.session.delete(webhook)
     db.session.commit()
@@ -499,13 +550,12 @@ def delete_webhook(id):
     return redirect(url_for('main.notification_settings'))
 
 @main.route('/test_webhook/<int:webhook_id>', methods=['POST'])
-@login_required
 def test_webhook(webhook_id):
     """Send a test webhook to verify configuration"""
     from app.webhooks import send_test_webhook
     from flask import current_app
     
-    webhook = Webhook.query.filter_by(id=webhook_id, user_id=current_user.id).first_or_404()
+    webhook = _owned_or_404(Webhook, webhook_id)
     
     # Send test webhook
     result = send_test_webhook(current_app._get_current_object(), webhook, current_user)
@@ -518,27 +568,23 @@ def test_webhook(webhook_id):
     return redirect(url_for('main.notification_settings'))
 
 @main.route('/general_settings', methods=['GET', 'POST'])
-@login_required
 def general_settings():
-    settings = current_user.settings or UserSettings(user_id=current_user.id)
+    settings = g.settings
     form = GeneralSettingsForm(obj=settings)
-    # Apply user preferred provider before fetching
-    if settings.preferred_rate_provider:
-        defaults = ['frankfurter','floatrates','erapi_open']
-        priority = [settings.preferred_rate_provider] + [p for p in defaults if p != settings.preferred_rate_provider]
-        os.environ['CURRENCY_PROVIDER_PRIORITY'] = ','.join(priority)
-    # Fetch rates AFTER applying provider preference
+    # Preferred provider priority was applied in require_login; fetch rates with it
     rates = currency_converter.get_exchange_rates('EUR') or {}
     latest_record = ExchangeRate.query.filter_by(base_currency='EUR', provider=currency_converter.last_provider).order_by(ExchangeRate.created_at.desc()).first()
     last_updated = latest_record.created_at if latest_record else None
+    # Report a provider change queued on the currency scheduler once its fetch has finished
+    queued_provider = session.get('_queued_rate_provider')
+    if queued_provider and not rate_refresh_pending(current_app):
+        session.pop('_queued_rate_provider')
+        if currency_converter.last_provider != queued_provider:
+            flash(f"Preferred provider '{queued_provider}' unavailable; using '{currency_converter.last_provider}'.", 'warning')
 
     original_provider_pref = settings.preferred_rate_provider
     if form.validate_on_submit():
-        if not current_user.settings:
-            settings = UserSettings(user_id=current_user.id)
-            db.session.add(settings)
-        else:
-            settings = current_user.settings
+        settings = _ensure_settings()
         settings.currency = form.currency.data
         settings.timezone = form.timezone.data
         settings.preferred_rate_provider = form.preferred_rate_provider.data
@@ -546,15 +592,17 @@ def general_settings():
         settings.accent_color = form.accent_color.data
         settings.date_format = form.date_format.data
         db.session.commit()
-        # If provider changed, clear today's cache and force fetch
+        # If provider changed, fetch its rates now (on the currency scheduler when it runs)
         if settings.preferred_rate_provider and settings.preferred_rate_provider != original_provider_pref:
-            currency_converter.clear_today_cache('EUR')
-            defaults = ['frankfurter','floatrates','erapi_open']
-            priority = [settings.preferred_rate_provider] + [p for p in defaults if p != settings.preferred_rate_provider]
-            os.environ['CURRENCY_PROVIDER_PRIORITY'] = ','.join(priority)
-            currency_converter.get_exchange_rates('EUR', force_refresh=True)
-            if currency_converter.last_provider != settings.preferred_rate_provider:
-                flash(f"Preferred provider '{settings.preferred_rate_provider}' unavailable; using '{currency_converter.last_provider}'.", 'warning')
+            _apply_provider_pref(settings)
+            if schedule_exchange_rate_refresh(current_app._get_current_object()):
+                session['_queued_rate_provider'] = settings.preferred_rate_provider
+                flash(f"Fetching rates from '{settings.preferred_rate_provider}'. They will show here shortly.", 'info')
+            else:
+                currency_converter.clear_today_cache('EUR')
+                currency_converter.get_exchange_rates('EUR', force_refresh=True)
+                if currency_converter.last_provider != settings.preferred_rate_provider:
+                    flash(f"Preferred provider '{settings.preferred_rate_provider}' unavailable; using '{currency_converter.last_provider}'.", 'warning')
         flash('General settings updated successfully!', 'success')
         return redirect(url_for('main.general_settings'))
     # If provider set, ensure form reflects it
@@ -563,42 +611,47 @@ def general_settings():
     return render_template('general_settings.html', form=form, rates=rates, last_updated=last_updated, provider=currency_converter.last_provider, currency_converter=currency_converter, requested_provider=settings.preferred_rate_provider)
 
 @main.route('/analytics')
-@login_required
 def analytics():
-    subscriptions = Subscription.query.filter_by(user_id=current_user.id).all()
-    user_settings = current_user.settings or UserSettings()
+    user_settings = g.settings
     display_currency = request.args.get('currency', user_settings.currency)
-    if user_settings.preferred_rate_provider:
-        defaults = ['frankfurter','floatrates','erapi_open']
-        priority = [user_settings.preferred_rate_provider] + [p for p in defaults if p != user_settings.preferred_rate_provider]
-        os.environ['CURRENCY_PROVIDER_PRIORITY'] = ','.join(priority)
     today = date.today()
-    active_subs = [s for s in subscriptions if s.is_active and (not s.end_date or s.end_date >= today)]
-    total_monthly = sum(sub.get_monthly_cost_in_currency(display_currency) for sub in active_subs)
-    total_yearly = sum(sub.get_yearly_cost_in_currency(display_currency) for sub in active_subs)
-    category_costs = {}
-    for sub in active_subs:
-        category = sub.category or 'other'
-        if category not in category_costs:
-            category_costs[category] = 0
-        category_costs[category] += sub.get_monthly_cost_in_currency(display_currency)
-    cycle_costs = {}
-    for sub in active_subs:
-        cycle = sub.billing_cycle
-        if cycle not in cycle_costs:
-            cycle_costs[cycle] = 0
-        cycle_costs[cycle] += sub.get_monthly_cost_in_currency(display_currency)
-    upcoming = []
-    for sub in subscriptions:
-        if sub.end_date and sub.is_active:
-            days_left = sub.days_until_expiry()
-            if days_left is not None and days_left <= 30:
-                upcoming.append({
-                    'subscription': sub,
-                    'days_left': days_left,
-                    'cost_in_display_currency': sub.get_raw_cost_in_currency(display_currency)
-                })
-    upcoming.sort(key=lambda x: x['days_left'])
+    user_subs = Subscription.query.filter_by(user_id=current_user.id)
+    active_subs = user_subs.filter(
+        Subscription.is_active == True,
+        db.or_(Subscription.end_date.is_(None), Subscription.end_date >= today)
+    )
+
+    def summarize():
+        # Costs are summed per group in SQL; the per-category totals also give the overall total
+        category_costs = {}
+        for category, cost in aggregate_costs(active_subs, display_currency, Subscription.category).items():
+            category = category or 'other'
+            category_costs[category] = category_costs.get(category, 0) + cost
+        cycle_costs = aggregate_costs(active_subs, display_currency, Subscription.billing_cycle)
+        total_count, active_count = user_subs.with_entities(
+            func.count(Subscription.id),
+            func.count(case((active_subs.whereclause, 1)))
+        ).one()
+        return category_costs, cycle_costs, total_count, active_count
+
+    # Today's newest stored rates, as in the chart's ETag, so totals follow a rate refresh at once
+    rates_stamp = db.session.scalar(select(func.max(ExchangeRate.created_at)).where(ExchangeRate.date == today))
+    category_costs, cycle_costs, total_count, active_count = _cached_for_user(
+        'analytics', summarize, display_currency, user_settings.preferred_rate_provider, today, rates_stamp)
+    total_monthly = math.fsum(category_costs.values())
+    total_yearly = total_monthly * 12
+    # Only rows ending within 30 days come back, already in days-left order; active rows whose
+    # end date has passed show 0 days left, as Subscription.days_until_expiry() reports them
+    expiring = user_subs.filter(
+        Subscription.is_active == True,
+        Subscription.end_date.isnot(None),
+        Subscription.end_date <= today + timedelta(days=30)
+    ).order_by(Subscription.end_date).options(raiseload('*'))
+    upcoming = [{
+        'subscription': sub,
+        'days_left': max(0, (sub.end_date - today).days),
+        'cost_in_display_currency': sub.get_raw_cost_in_currency(display_currency)
+    } for sub in expiring]
     currency_symbol = currency_converter.get_currency_symbol(display_currency)
     active_provider = currency_converter.last_provider
     return render_template('analytics.html',
@@ -607,32 +660,34 @@ def analytics():
                          category_costs=category_costs,
                          cycle_costs=cycle_costs,
                          upcoming=upcoming,
-                         active_count=len(active_subs),
-                         total_count=len(subscriptions),
+                         active_count=active_count,
+                         total_count=total_count,
                          user_currency=display_currency,
                          currency_symbol=currency_symbol,
                          rate_provider=active_provider)
 
 @main.route('/api/subscription_data')
-@login_required
 def api_subscription_data():
-    subscriptions = Subscription.query.filter_by(user_id=current_user.id, is_active=True).all()
-    user_settings = current_user.settings or UserSettings()
+    user_settings = g.settings
+    etag = _user_data_etag(user_settings)
+    if etag in request.if_none_match:
+        return _not_modified(etag)
     display_currency = request.args.get('currency', user_settings.currency)
-    if user_settings.preferred_rate_provider:
-        defaults = ['frankfurter','floatrates','erapi_open']
-        priority = [user_settings.preferred_rate_provider] + [p for p in defaults if p != user_settings.preferred_rate_provider]
-        os.environ['CURRENCY_PROVIDER_PRIORITY'] = ','.join(priority)
-    category_data = {}
-    for sub in subscriptions:
-        category = sub.category or 'other'
-        if category not in category_data:
-            category_data[category] = 0
-        category_data[category] += sub.get_monthly_cost_in_currency(display_currency)
-    return jsonify(category_data)
+
+    def summarize():
+        active_subs = Subscription.query.filter_by(user_id=current_user.id, is_active=True)
+        category_data = {}
+        for category, cost in aggregate_costs(active_subs, display_currency, Subscription.category).items():
+            category = category or 'other'
+            category_data[category] = category_data.get(category, 0) + cost
+        return category_data
+
+    # The ETag already covers every input (filters, settings, the date and today's rates), so a
+    # same-day rate refresh can't serve the old totals under the new ETag
+    category_data = _cached_for_user('subscription_data', summarize, etag)
+    return _revalidate_with_etag(jsonify(category_data), etag)
 
 @main.route('/debug/refresh_rates')
-@login_required
 def debug_refresh_rates():
     currency_converter.clear_today_cache('EUR')
     rates = currency_converter.get_exchange_rates('EUR', force_refresh=True) or {}
@@ -644,14 +699,14 @@ def debug_refresh_rates():
     return jsonify({'count': len(rates),'usd_rate_raw': rates.get('USD'),'sample_conversions': sample})
 
 @main.route('/refresh_rates', methods=['POST'])
-@login_required
 def refresh_rates():
     """Force refresh exchange rates and redirect back to general settings."""
-    settings = current_user.settings or UserSettings()
-    if settings.preferred_rate_provider:
-        defaults = ['frankfurter','floatrates','erapi_open']
-        priority = [settings.preferred_rate_provider] + [p for p in defaults if p != settings.preferred_rate_provider]
-        os.environ['CURRENCY_PROVIDER_PRIORITY'] = ','.join(priority)
+    settings = g.settings
+    # With the worker handling one request at a time, the provider calls run on the currency
+    # scheduler; the stored rates keep serving pages until the job saves the new ones
+    if schedule_exchange_rate_refresh(current_app._get_current_object()):
+        flash('Exchange rate refresh started. The updated rates will show here shortly.', 'info')
+        return redirect(url_for('main.general_settings'))
     currency_converter.clear_today_cache('EUR')
     rates = currency_converter.get_exchange_rates('EUR', force_refresh=True) or {}
     if settings.preferred_rate_provider and currency_converter.last_provider != settings.preferred_rate_provider:
@@ -662,13 +717,11 @@ def refresh_rates():
     return redirect(url_for('main.general_settings'))
 
 @main.route('/payment_methods')
-@login_required
 def payment_methods():
     payment_methods = PaymentMethod.query.filter_by(user_id=current_user.id).all()
     return render_template('payment_methods.html', payment_methods=payment_methods)
 
 @main.route('/add_payment_method', methods=['GET', 'POST'])
-@login_required
 def add_payment_method():
     form = PaymentMethodForm()
     if form.validate_on_submit():
@@ -680,12 +733,8 @@ def add_payment_method():
     return render_template('add_payment_method.html', form=form)
 
 @main.route('/edit_payment_method/<int:id>', methods=['GET', 'POST'])
-@login_required
 def edit_payment_method(id):
-    payment_method = PaymentMethod.query.get_or_404(id)
-    if payment_method.user_id != current_user.id:
-        flash('Unauthorized access', 'error')
-        return redirect(url_for('main.payment_methods'))
+    payment_method = _owned_or_404(PaymentMethod, id)
     form = PaymentMethodForm(obj=payment_method)
     if form.validate_on_submit():
         payment_method.name = form.name.data
@@ -698,15 +747,11 @@ def edit_payment_method(id):
     return render_template('edit_payment_method.html', form=form, payment_method=payment_method)
 
 @main.route('/delete_payment_method/<int:id>')
-@login_required
 def delete_payment_method(id):
-    payment_method = PaymentMethod.query.get_or_404(id)
-    if payment_method.user_id != current_user.id:
-        flash('Unauthorized access', 'error')
-        return redirect(url_for('main.payment_methods'))
-    subscriptions_using = Subscription.query.filter_by(payment_method_id=id).all()
+    payment_method = _owned_or_404(PaymentMethod, id)
+    subscriptions_using = db.session.query(func.count(Subscription.id)).filter_by(payment_method_id=id).scalar()
     if subscriptions_using:
-        flash(f'Cannot delete payment method. It is used by {len(subscriptions_using)} subscription(s).', 'error')
+        flash(f'Cannot delete payment method. It is used by {subscriptions_using} subscription(s).', 'error')
         return redirect(url_for('main.payment_methods'))
     db.session.delete(payment_method)
     db.session.commit()
@@ -715,17 +760,16 @@ def delete_payment_method(id):
 
 # Admin User Management Routes
 @main.route('/admin/users')
-@login_required
 def admin_users():
     if not current_user.is_admin:
         flash('Administrator access required.', 'error')
         return redirect(url_for('main.dashboard'))
     
-    users = User.query.all()
+    # The template shows a subscription count per user; batch-load them instead of one query per row
+    users = User.query.options(selectinload(User.subscriptions)).all()
     return render_template('admin_users.html', users=users)
 
 @main.route('/admin/users/add', methods=['GET', 'POST'])
-@login_required
 def admin_add_user():
     if not current_user.is_admin:
         flash('Administrator access required.', 'error')
@@ -753,7 +797,7 @@ def admin_add_user():
             )
             user.set_password(form.password.data)
             db.session.add(user)
-            db.session.commit()
+            db.session.flush()  # assigns user.id; user and settings commit together
             
             # Create default user settings
             settings = UserSettings(user_id=user.id)
@@ -770,7 +814,6 @@ def admin_add_user():
     return render_template('admin_add_user.html', form=form)
 
 @main.route('/admin/users/edit/<int:user_id>', methods=['GET', 'POST'])
-@login_required
 def admin_edit_user(user_id):
     if not current_user.is_admin:
         flash('Administrator access required.', 'error')
@@ -820,7 +863,6 @@ def admin_edit_user(user_id):
     return render_template('admin_edit_user.html', form=form, user=user, is_last_admin=is_last_admin)
 
 @main.route('/admin/users/delete/<int:user_id>')
-@login_required
 def admin_delete_user(user_id):
     if not current_user.is_admin:
         flash('Administrator access required.', 'error')
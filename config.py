@@ -99,3 +99,13 @@ class Config:
     
     # Session configuration
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)  # Sessions last 7 days
+
+    # Per-user aggregates for analytics and chart data (SimpleCache is per process;
+    # CACHE_TYPE=RedisCache with CACHE_REDIS_URL shares it, and needs the redis package)
+    CACHE_TYPE = os.environ.get('CACHE_TYPE', 'SimpleCache')
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+    CACHE_DEFAULT_TIMEOUT = int(os.environ.get('CACHE_DEFAULT_TIMEOUT') or 60)
+
+    # Compiled templates are cached on disk so new workers skip Jinja compilation (empty to disable).
+    # Unset uses Jinja's own per-user, owner-only directory under the system temp dir
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR')
@@ -1,5 +1,6 @@
 # Gunicorn configuration file
 import logging
+import os
 
 
 class HealthCheckFilter(logging.Filter):
@@ -23,7 +24,11 @@ backlog = 2048
 # scheduler causing duplicate notifications. If you need more throughput, consider an
 # external task queue (e.g. Celery + Redis) and re-enable multiple workers then.
 workers = 1
-worker_class = "sync"
+# Views mostly wait on the database and the exchange-rate providers. With
+# GUNICORN_WORKER_CLASS=gevent the single worker serves many requests
+# concurrently (gunicorn monkey-patches sockets and threads in gevent workers),
+# up to worker_connections at a time.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
 worker_connections = 1000
 timeout = 120  # Increased from 60s to 120s for longer operations
 keepalive = 2
@@ -0,0 +1,129 @@
+"""Shared fixtures: a fresh application on its own SQLite database, and signed-in clients."""
+
+import os
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import event
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+# Stored for every provider, so rate lookups never reach the network
+TEST_RATES = {"EUR": "1", "USD": "1.1", "GBP": "0.85"}
+
+
+@pytest.fixture()
+def app(tmp_path, monkeypatch):
+    """Application bound to a throwaway SQLite file; the background schedulers never start."""
+    from config import Config, get_engine_options
+
+    database_url = f"sqlite:///{tmp_path / 'test.db'}"
+    monkeypatch.setenv("DATABASE_URL", database_url)
+    monkeypatch.setattr(Config, "SQLALCHEMY_DATABASE_URI", database_url)
+    monkeypatch.setattr(Config, "SQLALCHEMY_ENGINE_OPTIONS", get_engine_options())
+    monkeypatch.setattr(Config, "JINJA_BYTECODE_CACHE_DIR", "")
+
+    from app import create_app, db
+    from app.models import ExchangeRate
+
+    # Parsed rates are cached per process, not per app
+    ExchangeRate.clear_rates_cache()
+    _app = create_app()
+    _app.config["TESTING"] = True
+    _app.config["WTF_CSRF_ENABLED"] = False
+    _app._scheduler_started = True
+
+    yield _app
+
+    with _app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+    ExchangeRate.clear_rates_cache()
+
+
+@pytest.fixture()
+def rates(app):
+    """Today's exchange rates, stored for every provider."""
+    from app.currency import PROVIDERS
+    from app.models import ExchangeRate
+
+    with app.app_context():
+        for provider in PROVIDERS:
+            ExchangeRate.save_rates(TEST_RATES, "EUR", provider=provider)
+    return TEST_RATES
+
+
+def create_user(app, username="alice", password="secret123", with_settings=True, **settings):
+    """Add a user (with a settings row unless with_settings is False) and return its id."""
+    from app import db
+    from app.models import User, UserSettings
+
+    with app.app_context():
+        user = User(username=username, email=f"{username}@example.com")
+        user.set_password(password)
+        db.session.add(user)
+        db.session.flush()
+        if with_settings:
+            db.session.add(UserSettings(user_id=user.id, **settings))
+        db.session.commit()
+        return user.id
+
+
+def add_subscription(app, user_id, name, end_date=None, **kwargs):
+    """Add an active monthly EUR 10 subscription for user_id; kwargs override any column."""
+    from app import db
+    from app.models import Subscription
+
+    values = dict(
+        name=name,
+        company="Example Co",
+        cost=10.0,
+        currency="EUR",
+        billing_cycle="monthly",
+        start_date=date.today() - timedelta(days=60),
+        end_date=end_date,
+        user_id=user_id,
+        is_active=True,
+    )
+    values.update(kwargs)
+    with app.app_context():
+        db.session.add(Subscription(**values))
+        db.session.commit()
+
+
+def login(client, username="alice", password="secret123"):
+    response = client.post("/login", data={"username": username, "password": password})
+    assert response.status_code == 302
+    return client
+
+
+@contextmanager
+def capture_sql(app):
+    """Collect the SQL statements the app's engine runs inside the block"""
+    from app import db
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture()
+def user(app, rates):
+    """Id of a regular user with default settings."""
+    return create_user(app)
+
+
+@pytest.fixture()
+def client(app, user):
+    """Test client signed in as the user fixture."""
+    return login(app.test_client())
@@ -0,0 +1,110 @@
+"""Tests for the analytics page."""
+
+import re
+from datetime import date, timedelta
+
+from app import cache, db
+from app.currency import PROVIDERS
+from app.models import ExchangeRate, Subscription, invalidate_user_cache, user_cache_namespace
+from tests.conftest import add_subscription, capture_sql
+
+
+def _upcoming(response):
+    """(name, days left) pairs in the order the upcoming list renders them"""
+    body = response.get_data(as_text=True)
+    return [(name, int(days)) for name, days in
+            re.findall(r"<strong>([^<]+)</strong><br>.*?(-?\d+) days?\s*</span>", body, re.S)]
+
+
+def test_upcoming_lists_renewals_within_30_days_in_order(app, user, client):
+    today = date.today()
+    add_subscription(app, user, "Later", today + timedelta(days=20))
+    add_subscription(app, user, "Soon", today + timedelta(days=2))
+    add_subscription(app, user, "Far", today + timedelta(days=45))
+    add_subscription(app, user, "Open ended", None)
+    add_subscription(app, user, "Paused", today + timedelta(days=5), is_active=False)
+
+    response = client.get("/analytics")
+
+    assert response.status_code == 200
+    assert _upcoming(response) == [("Soon", 2), ("Later", 20)]
+
+
+def test_expired_active_subscription_shows_zero_days_left(app, user, client):
+    today = date.today()
+    add_subscription(app, user, "Lapsed", today - timedelta(days=5))
+    add_subscription(app, user, "Soon", today + timedelta(days=3))
+
+    response = client.get("/analytics")
+
+    assert response.status_code == 200
+    assert _upcoming(response) == [("Lapsed", 0), ("Soon", 3)]
+    assert "-5 day" not in response.get_data(as_text=True)
+
+
+def test_analytics_query_count_does_not_grow_with_subscriptions(app, user, client):
+    def add_subscriptions(start, stop):
+        for i in range(start, stop):
+            add_subscription(app, user, f"S{i}", date.today() + timedelta(days=5 * i),
+                              currency=["EUR", "USD", "GBP"][i % 3], category=["software", "gaming", None][i % 3])
+
+    # Today's rates are parsed once per process; have them loaded before counting
+    add_subscriptions(0, 2)
+    client.get("/analytics")
+    add_subscriptions(2, 4)
+    with capture_sql(app) as few:
+        assert client.get("/analytics").status_code == 200
+    add_subscriptions(4, 16)
+    with capture_sql(app) as many:
+        assert client.get("/analytics").status_code == 200
+
+    # User with settings, the rates stamp, category and billing cycle totals, counts and the
+    # upcoming renewals; cached totals make a repeat visit cheaper still
+    assert len(many) == len(few) <= 6
+    with capture_sql(app) as repeat:
+        assert client.get("/analytics").status_code == 200
+    assert len(repeat) < len(many)
+
+
+def test_evicted_cache_version_never_maps_back_to_an_older_namespace(app, user):
+    with app.app_context():
+        first = user_cache_namespace(user)
+        invalidate_user_cache(user)
+        second = user_cache_namespace(user)
+        # SimpleCache prunes entries, the version key included, once it fills up
+        cache.delete(f"user-data-version:{user}")
+        third = user_cache_namespace(user)
+        assert user_cache_namespace(user) == third
+
+    assert len({first, second, third}) == 3
+    assert not third.endswith(":None")
+
+
+def test_user_cache_moves_to_a_new_namespace_only_on_commit(app, user):
+    values = dict(name="Flushed", company="Example Co", cost=10.0, currency="EUR", billing_cycle="monthly",
+                  start_date=date.today(), user_id=user, is_active=True)
+    with app.app_context():
+        before = user_cache_namespace(user)
+        db.session.add(Subscription(**values))
+        db.session.flush()
+        assert user_cache_namespace(user) == before
+        db.session.rollback()
+        assert user_cache_namespace(user) == before
+
+        db.session.add(Subscription(**values))
+        db.session.commit()
+        assert user_cache_namespace(user) != before
+
+
+def test_analytics_totals_are_recomputed_after_a_rate_refresh(app, user, rates, client):
+    add_subscription(app, user, "Dollars", None, currency="USD")
+    client.get("/analytics")
+    with capture_sql(app) as cached:
+        client.get("/analytics")
+    with app.app_context():
+        for provider in PROVIDERS:
+            ExchangeRate.save_rates(dict(rates, USD="1.2"), "EUR", provider=provider)
+    with capture_sql(app) as refreshed:
+        client.get("/analytics")
+
+    assert len(refreshed) > len(cached)
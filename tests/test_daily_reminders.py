@@ -10,16 +10,10 @@ Covers:
 - Timezone-aware scheduling (notification sent in the user's local timezone)
 """
 
-import os
 import pytest
 from datetime import datetime, timedelta, timezone, date
 from unittest.mock import patch, MagicMock
 
-os.environ.setdefault("SECRET_KEY", "test-secret-key")
-# Use a file-backed SQLite DB so Flask-SQLAlchemy's pool settings are valid in tests
-_TEST_DB_PATH = "/tmp/test_daily_reminders.db"
-os.environ["DATABASE_URL"] = f"sqlite:///{_TEST_DB_PATH}"
-
 # ---------------------------------------------------------------------------
 # Test date constants
 # ---------------------------------------------------------------------------
@@ -38,39 +32,14 @@ DAY_BEFORE_WINDOW = datetime(2026, 3, 28, 9, 0, tzinfo=timezone.utc)  # 9 days b
 SUB_END_DATE = date(2026, 4, 6)   # Subscription expiry date (5 days from DAY1)
 
 
-@pytest.fixture(scope="module")
-def app():
-    """Create a Flask application configured for testing."""
-    import importlib
-    import app as app_pkg
-
-    # Force re-import so that the DATABASE_URL env var above takes effect before
-    # the config module caches the connection string.
-    importlib.reload(importlib.import_module("config"))
-    importlib.reload(app_pkg)
-
-    from app import create_app, db as _db
-
-    _app = create_app()
-    _app.config["TESTING"] = True
-    _app.config["WTF_CSRF_ENABLED"] = False
-
-    with _app.app_context():
-        _db.create_all()
-
-    yield _app
-
-    # Cleanup the test database file after the test session
-    if os.path.exists(_TEST_DB_PATH):
-        os.remove(_TEST_DB_PATH)
-
-
 @pytest.fixture()
 def db(app):
     """Provide a clean database session for each test."""
     from app import db as _db
 
     with app.app_context():
+        # Start from empty tables, without the admin user create_app() bootstraps
+        _db.drop_all()
         _db.create_all()
         yield _db
         _db.session.remove()
@@ -0,0 +1,90 @@
+"""Tests for the dashboard's subscription list."""
+
+import re
+from datetime import date, timedelta
+
+import pytest
+
+from app import db
+from app.models import PaymentMethod, Subscription
+from tests.conftest import add_subscription, capture_sql
+
+
+def _listed_names(response):
+    """Subscription names in the order the dashboard table renders them"""
+    assert response.status_code == 200
+    return re.findall(r"^\s*<strong>([A-Za-z][^<]*)</strong>\s*$", response.get_data(as_text=True), re.M)
+
+
+@pytest.mark.parametrize(
+    "order, expected",
+    [
+        ("asc", ["Soon", "Later", "Open A", "Open B"]),
+        ("desc", ["Later", "Soon", "Open A", "Open B"]),
+    ],
+)
+def test_end_date_sort_puts_open_ended_subscriptions_last(app, user, client, order, expected):
+    today = date.today()
+    add_subscription(app, user, "Open B")
+    add_subscription(app, user, "Later", today + timedelta(days=90))
+    add_subscription(app, user, "Open A")
+    add_subscription(app, user, "Soon", today + timedelta(days=30))
+
+    response = client.get(f"/dashboard?status=all&sort=end_date&order={order}")
+
+    assert _listed_names(response) == expected
+
+
+@pytest.mark.parametrize("path", ["/dashboard?status=active", "/analytics"])
+def test_active_filter_matches_partial_index_predicate(app, user, client, path):
+    add_subscription(app, user, "Hosting")
+
+    with capture_sql(app) as statements:
+        assert client.get(path).status_code == 200
+
+    where_clauses = [re.split(r"\sWHERE\s", s, maxsplit=1)[-1] for s in statements
+                     if "FROM subscription" in s and re.search(r"\sWHERE\s", s)]
+    where_clauses = [w for w in where_clauses if "is_active" in w]
+    assert where_clauses
+    # ix_sub_active_user is declared WHERE is_active = 1; SQLite won't match it against IS 1
+    assert not [w for w in where_clauses if "is_active IS 1" in w]
+    assert [w for w in where_clauses if "subscription.is_active = 1" in w]
+
+
+def test_partial_index_serves_the_active_filter(app):
+    with app.app_context():
+        query = db.select(Subscription.id).where(Subscription.user_id == 1, Subscription.is_active == True)
+        sql = str(query.compile(db.engine, compile_kwargs={"literal_binds": True}))
+        sql = sql.replace("FROM subscription", "FROM subscription INDEXED BY ix_sub_active_user")
+        # INDEXED BY fails with "no query solution" when the index can't serve the WHERE clause
+        plan = db.session.execute(db.text(f"EXPLAIN QUERY PLAN {sql}")).all()
+
+    assert "ix_sub_active_user" in plan[0][-1]
+
+
+def test_dashboard_query_count_does_not_grow_with_subscriptions(app, user, client):
+    with app.app_context():
+        card = PaymentMethod(name="Visa", payment_type="credit_card", last_four="1234", user_id=user)
+        db.session.add(card)
+        db.session.commit()
+        card_id = card.id
+
+    def add_subscriptions(start, stop):
+        for i in range(start, stop):
+            add_subscription(app, user, f"S{i}", date.today() + timedelta(days=5 * i),
+                              currency=["EUR", "USD", "GBP"][i % 3], category=["software", "gaming", None][i % 3],
+                              payment_method_id=card_id if i % 2 else None)
+
+    # Today's rates are parsed once per process; have them loaded before counting
+    add_subscriptions(0, 2)
+    client.get("/dashboard?status=all")
+    add_subscriptions(2, 4)
+    with capture_sql(app) as few:
+        assert client.get("/dashboard?status=all").status_code == 200
+    add_subscriptions(4, 16)
+    with capture_sql(app) as many:
+        assert client.get("/dashboard?status=all").status_code == 200
+
+    # User with settings, ETag stamp, subscriptions with payment methods and per-currency totals,
+    # today's rates and the category list
+    assert len(many) == len(few) <= 5
@@ -0,0 +1,67 @@
+"""Tests for users without a settings row, who get the shared DEFAULT_SETTINGS."""
+
+from datetime import date, timedelta
+
+import pytest
+
+from app import db
+from app.models import DEFAULT_SETTINGS, Subscription, UserSettings
+from tests.conftest import create_user, login
+
+
+@pytest.fixture()
+def client(app, rates):
+    user_id = create_user(app, username="nosettings", with_settings=False)
+    with app.app_context():
+        db.session.add(Subscription(
+            name="Hosting",
+            company="Example Co",
+            category="software",
+            cost=11.0,
+            currency="USD",
+            billing_cycle="monthly",
+            start_date=date.today() - timedelta(days=10),
+            end_date=date.today() + timedelta(days=3),
+            user_id=user_id,
+        ))
+        db.session.commit()
+    return login(app.test_client(), username="nosettings")
+
+
+def test_defaults_come_from_the_column_defaults():
+    assert DEFAULT_SETTINGS.currency == "EUR"
+    assert DEFAULT_SETTINGS.notification_days == 7
+    assert DEFAULT_SETTINGS.timezone == "UTC"
+
+
+def test_shared_defaults_cannot_be_changed():
+    with pytest.raises(AttributeError):
+        DEFAULT_SETTINGS.currency = "USD"
+    with pytest.raises(AttributeError):
+        DEFAULT_SETTINGS.extra = True
+    assert DEFAULT_SETTINGS.currency == "EUR"
+
+
+@pytest.mark.parametrize("path", ["/dashboard", "/dashboard?status=expiring", "/analytics"])
+def test_pages_render_with_default_settings(client, path):
+    response = client.get(path)
+
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    assert "Hosting" in body
+    assert "€10.00" in body
+
+
+def test_chart_data_uses_the_default_currency(client):
+    response = client.get("/api/subscription_data")
+
+    assert response.status_code == 200
+    assert response.get_json() == {"software": pytest.approx(10.0)}
+
+
+def test_reading_pages_does_not_create_a_settings_row(app, client):
+    client.get("/dashboard")
+    client.get("/analytics")
+
+    with app.app_context():
+        assert UserSettings.query.join(UserSettings.user).filter_by(username="nosettings").count() == 0
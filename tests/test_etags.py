@@ -0,0 +1,111 @@
+"""Tests for conditional GETs (ETag / If-None-Match) on per-user pages."""
+
+from datetime import date, timedelta
+
+import pytest
+
+from app import db
+from app.currency import PROVIDERS
+from app.models import ExchangeRate, Subscription
+
+PAGES = ["/dashboard", "/api/subscription_data"]
+
+
+@pytest.fixture()
+def subscription(app, user):
+    with app.app_context():
+        sub = Subscription(
+            name="Streaming",
+            company="Example Co",
+            category="entertainment",
+            cost=12.0,
+            currency="USD",
+            billing_cycle="monthly",
+            start_date=date.today() - timedelta(days=10),
+            user_id=user,
+        )
+        db.session.add(sub)
+        db.session.commit()
+        return sub.id
+
+
+def _etag(client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    etag, weak = response.get_etag()
+    assert etag and not weak
+    return etag
+
+
+@pytest.mark.parametrize("path", PAGES)
+def test_response_carries_revalidation_etag(client, subscription, path):
+    response = client.get(path)
+
+    assert response.status_code == 200
+    assert response.get_etag()[0]
+    assert response.cache_control.private
+    assert response.cache_control.no_cache
+
+
+@pytest.mark.parametrize("path", PAGES)
+def test_matching_if_none_match_returns_304(client, subscription, path):
+    etag = _etag(client, path)
+
+    response = client.get(path, headers={"If-None-Match": f'"{etag}"'})
+
+    assert response.status_code == 304
+    assert response.get_etag()[0] == etag
+    assert response.get_data() == b""
+
+
+def test_pending_flash_is_never_answered_with_304(client, subscription):
+    etag = _etag(client, "/dashboard")
+    with client.session_transaction() as session:
+        session["_flashes"] = [("success", "Saved")]
+
+    response = client.get("/dashboard", headers={"If-None-Match": f'"{etag}"'})
+
+    assert response.status_code == 200
+    assert "Saved" in response.get_data(as_text=True)
+    assert response.get_etag() == (None, None)
+
+
+@pytest.mark.parametrize("path", PAGES)
+def test_etag_changes_after_subscription_edit(client, subscription, path):
+    etag = _etag(client, path)
+
+    client.get(f"/toggle_subscription/{subscription}", follow_redirects=True)
+
+    assert _etag(client, path) != etag
+
+
+@pytest.mark.parametrize("path", PAGES)
+def test_etag_changes_after_settings_change(client, subscription, path):
+    etag = _etag(client, path)
+
+    response = client.post("/notification_settings", data={"notification_days": "14", "notification_time": "8"},
+                           follow_redirects=True)
+    assert response.status_code == 200
+
+    assert _etag(client, path) != etag
+
+
+@pytest.mark.parametrize("path", PAGES)
+def test_etag_changes_after_rate_refresh(app, client, subscription, path):
+    etag = _etag(client, path)
+
+    with app.app_context():
+        for provider in PROVIDERS:
+            ExchangeRate.save_rates({"EUR": "1", "USD": "1.25", "GBP": "0.85"}, "EUR", provider=provider)
+
+    assert _etag(client, path) != etag
+
+
+def test_chart_data_follows_same_day_rate_refresh(app, client, subscription):
+    assert client.get("/api/subscription_data").get_json() == {"entertainment": pytest.approx(12.0 / 1.1)}
+
+    with app.app_context():
+        for provider in PROVIDERS:
+            ExchangeRate.save_rates({"EUR": "1", "USD": "1.25", "GBP": "0.85"}, "EUR", provider=provider)
+
+    assert client.get("/api/subscription_data").get_json() == {"entertainment": pytest.approx(12.0 / 1.25)}
@@ -0,0 +1,35 @@
+"""Tests for the orjson-backed JSON provider."""
+
+import json
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+from flask import jsonify
+from flask.json.provider import DefaultJSONProvider
+
+
+def test_dumps_encodes_like_flasks_default_provider(app):
+    value = {"b": 1, "a": date(2026, 1, 2), "c": datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+             "d": Decimal("1.50")}
+
+    dumped = app.json.dumps(value)
+
+    assert json.loads(dumped) == json.loads(DefaultJSONProvider(app).dumps(value))
+    assert list(json.loads(dumped)) == ["a", "b", "c", "d"]
+    assert app.json.dumps({1: "one"}) == '{"1":"one"}'
+
+
+def test_dumps_honours_caller_options(app):
+    assert list(json.loads(app.json.dumps({"b": 1, "a": 2}, sort_keys=False))) == ["b", "a"]
+    assert app.json.dumps({"a": 1}, indent=2) == '{\n  "a": 1\n}'
+    assert app.json.dumps({"a": object()}, default=lambda o: "custom") == '{"a":"custom"}'
+    # No orjson equivalent, so the stdlib encoder handles it
+    assert app.json.dumps({"a": 1, "b": 2}, separators=(",", "=")) == '{"a"=1,"b"=2}'
+
+
+def test_jsonify_uses_the_provider(app):
+    with app.test_request_context():
+        response = jsonify(b=1, a=Decimal("2.5"))
+
+    assert response.mimetype == "application/json"
+    assert response.get_data(as_text=True) == '{"a":"2.5","b":1}'
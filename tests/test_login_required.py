@@ -0,0 +1,91 @@
+"""Tests for the login gate on the main blueprint and the public endpoints around it."""
+
+from unittest.mock import patch
+from urllib.parse import urlparse
+
+import pytest
+
+from tests.conftest import login
+
+PUBLIC_ENDPOINTS = {"main.health_check", "main.favicon"}
+
+
+def _is_login_redirect(response):
+    return response.status_code == 302 and urlparse(response.headers["Location"]).path == "/login"
+
+
+def _main_routes(app):
+    """(method, url) for every method of every route on the main blueprint, with sample ids"""
+    for rule in app.url_map.iter_rules():
+        if not rule.endpoint.startswith("main.") or rule.endpoint in PUBLIC_ENDPOINTS:
+            continue
+        url = rule.build({argument: 1 for argument in rule.arguments})[1]
+        for method in sorted(rule.methods - {"HEAD", "OPTIONS"}):
+            yield method, url
+
+
+@pytest.fixture()
+def anonymous(app):
+    return app.test_client()
+
+
+def test_every_main_route_requires_login(app, anonymous):
+    routes = list(_main_routes(app))
+    assert ("GET", "/dashboard") in routes
+    assert ("POST", "/refresh_rates") in routes
+
+    not_redirected = [(method, url) for method, url in routes
+                      if not _is_login_redirect(anonymous.open(url, method=method))]
+
+    assert not_redirected == []
+
+
+def test_login_redirect_keeps_the_requested_page(anonymous):
+    response = anonymous.get("/analytics")
+
+    assert _is_login_redirect(response)
+    assert "next=%2Fanalytics" in response.headers["Location"]
+
+
+def test_health_is_public(anonymous):
+    response = anonymous.get("/health")
+
+    assert response.status_code == 200
+    assert response.get_json()["status"] == "healthy"
+
+
+def test_health_rechecks_rates_until_they_are_available(anonymous):
+    from app.currency import currency_converter
+
+    with patch.object(currency_converter, "_get_fallback_rates", side_effect=[{}, {"EUR": 1}]) as load:
+        probes = [anonymous.get("/health").get_json()["currency_rates"] for _ in range(3)]
+
+    assert probes == ["degraded", "ok", "ok"]
+    assert load.call_count == 2
+
+
+def test_login_page_is_public(anonymous):
+    assert anonymous.get("/login").status_code == 200
+    assert anonymous.get("/").status_code == 200
+
+
+def test_static_files_are_public(app, anonymous, tmp_path):
+    (tmp_path / "site.css").write_text("body {}")
+    app.static_folder = str(tmp_path)
+
+    assert anonymous.get("/static/site.css").status_code == 200
+    assert anonymous.get("/favicon.ico").status_code == 200
+
+
+def test_logout_ends_the_session(app, user):
+    client = login(app.test_client())
+    assert client.get("/dashboard").status_code == 200
+
+    response = client.get("/logout")
+
+    assert _is_login_redirect(response)
+    assert _is_login_redirect(client.get("/dashboard"))
+
+
+def test_logout_requires_login(anonymous):
+    assert _is_login_redirect(anonymous.get("/logout"))
@@ -0,0 +1,173 @@
+"""Tests for normalising subscription costs to a monthly amount."""
+
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Subscription
+
+
+def _make_subscription(billing_cycle, cost=12.0, **kwargs):
+    return Subscription(
+        name="Cost Test",
+        company="Example Co",
+        cost=cost,
+        currency="EUR",
+        billing_cycle=billing_cycle,
+        start_date=date(2026, 1, 1),
+        user_id=1,
+        is_active=True,
+        **kwargs,
+    )
+
+
+@pytest.mark.parametrize(
+    "billing_cycle, expected",
+    [
+        ("daily", 360.0),
+        ("weekly", 51.96),
+        ("bi-weekly", 26.04),
+        ("monthly", 12.0),
+        ("bi-monthly", 6.0),
+        ("quarterly", 4.0),
+        ("semi-annually", 2.0),
+        ("yearly", 1.0),
+    ],
+)
+def test_standard_cycles(billing_cycle, expected):
+    sub = _make_subscription(billing_cycle)
+
+    assert sub.get_monthly_cost() == pytest.approx(expected)
+    assert sub.get_yearly_cost() == pytest.approx(expected * 12)
+
+
+@pytest.mark.parametrize(
+    "period_type, period_value, expected",
+    [
+        ("days", 30, 12.0 / 30 * 30.44),
+        ("months", 4, 3.0),
+        ("years", 2, 0.5),
+    ],
+)
+def test_custom_cycles(period_type, period_value, expected):
+    sub = _make_subscription(
+        "custom",
+        custom_period_type=period_type,
+        custom_period_value=period_value,
+    )
+
+    assert sub.get_monthly_cost() == pytest.approx(expected)
+
+
+def test_custom_days_fallback_for_legacy_rows():
+    sub = _make_subscription("custom", custom_days=15)
+
+    assert sub.get_monthly_cost() == pytest.approx(12.0 / 15 * 30.44)
+
+
+def test_unknown_cycle_costs_nothing():
+    sub = _make_subscription("fortnightly-ish")
+
+    assert sub.get_monthly_cost() == 0
+
+
+@pytest.mark.parametrize(
+    "billing_cycle, extra",
+    [
+        ("daily", {}),
+        ("weekly", {}),
+        ("quarterly", {}),
+        ("yearly", {}),
+        ("custom", {"custom_period_type": "days", "custom_period_value": 45}),
+        ("custom", {"custom_period_type": "months", "custom_period_value": 4}),
+        ("custom", {"custom_period_type": "years", "custom_period_value": 2}),
+        ("custom", {"custom_days": 15}),
+        ("custom", {}),
+        ("fortnightly-ish", {}),
+    ],
+)
+def test_sql_expression_matches_python(billing_cycle, extra):
+    engine = create_engine("sqlite://")
+    db.metadata.create_all(engine, tables=[Subscription.__table__])
+    sub = _make_subscription(billing_cycle, **extra)
+
+    with Session(engine) as session:
+        session.add(sub)
+        session.commit()
+        expected = sub.get_monthly_cost()
+        result = session.execute(select(Subscription.monthly_cost_expression())).scalar_one()
+
+    assert result == pytest.approx(expected)
+
+
+def test_stored_monthly_cost_set_on_insert():
+    engine = create_engine("sqlite://")
+    db.metadata.create_all(engine, tables=[Subscription.__table__])
+    sub = _make_subscription("quarterly")
+
+    with Session(engine) as session:
+        session.add(sub)
+        session.commit()
+        stored = session.execute(select(Subscription.monthly_cost)).scalar_one()
+
+    assert stored == pytest.approx(4.0)
+
+
+@pytest.mark.parametrize(
+    "changes, expected",
+    [
+        ({"cost": 24.0}, 24.0),
+        ({"billing_cycle": "yearly"}, 1.0),
+        ({"billing_cycle": "custom", "custom_period_type": "months", "custom_period_value": 3}, 4.0),
+    ],
+)
+def test_stored_monthly_cost_recomputed_on_update(changes, expected):
+    engine = create_engine("sqlite://")
+    db.metadata.create_all(engine, tables=[Subscription.__table__])
+
+    with Session(engine) as session:
+        sub = _make_subscription("monthly")
+        session.add(sub)
+        session.commit()
+        for attribute, value in changes.items():
+            setattr(sub, attribute, value)
+        session.commit()
+        stored = session.execute(select(Subscription.monthly_cost)).scalar_one()
+
+    assert stored == pytest.approx(expected)
+
+
+def test_stored_monthly_cost_follows_custom_period_change():
+    engine = create_engine("sqlite://")
+    db.metadata.create_all(engine, tables=[Subscription.__table__])
+
+    with Session(engine) as session:
+        sub = _make_subscription("custom", custom_period_type="months", custom_period_value=4)
+        session.add(sub)
+        session.commit()
+        sub.custom_period_value = 2
+        session.commit()
+        stored = session.execute(select(Subscription.monthly_cost)).scalar_one()
+
+    assert stored == pytest.approx(6.0)
+
+
+def test_migration_backfills_missing_monthly_cost(app):
+    from app import migrate_database
+
+    with app.app_context():
+        db.session.add_all([_make_subscription("yearly"), _make_subscription("weekly", cost=10.0)])
+        db.session.commit()
+        # Rows written before the column existed have no stored value
+        db.session.execute(update(Subscription).values(monthly_cost=None))
+        db.session.commit()
+        assert db.session.execute(select(Subscription.monthly_cost)).scalars().all() == [None, None]
+
+        migrate_database()
+
+        stored = db.session.execute(select(Subscription.monthly_cost).order_by(Subscription.id)).scalars().all()
+
+    assert stored == [pytest.approx(1.0), pytest.approx(43.3)]
@@ -0,0 +1,61 @@
+"""Tests for User password hashing and legacy hash compatibility."""
+
+from werkzeug.security import generate_password_hash
+
+from app.models import User
+
+
+def test_new_passwords_use_argon2():
+    user = User(username="hash-test", email="hash@example.com")
+    user.set_password("correct horse")
+
+    assert user.password_hash.startswith("$argon2")
+    assert user.check_password("correct horse")
+    assert not user.check_password("battery staple")
+
+
+def test_legacy_werkzeug_hashes_still_verify():
+    user = User(username="legacy", email="legacy@example.com")
+    user.password_hash = generate_password_hash("old-secret")
+
+    assert user.check_password("old-secret")
+    assert not user.check_password("wrong")
+
+
+def test_missing_hash_never_matches():
+    user = User(username="nohash", email="nohash@example.com")
+
+    assert not user.check_password("anything")
+
+
+def test_authenticate(app, monkeypatch):
+    from app import db, models
+
+    dummy_calls = []
+    real_dummy = models._dummy_password_hash
+
+    def tracking_dummy():
+        dummy_calls.append(True)
+        return real_dummy()
+
+    monkeypatch.setattr(models, "_dummy_password_hash", tracking_dummy)
+
+    with app.app_context():
+        user = User(username="auth", email="auth@example.com")
+        user.set_password("s3cret")
+        db.session.add(user)
+        db.session.commit()
+
+        assert User.authenticate("auth", "s3cret").id == user.id
+        assert User.authenticate("auth", "wrong") is None
+        assert dummy_calls == []
+
+        # Legacy werkzeug hashes are upgraded on the next successful login
+        user.password_hash = generate_password_hash("s3cret")
+        db.session.commit()
+        assert User.authenticate("auth", "s3cret").id == user.id
+        assert db.session.get(User, user.id).password_hash.startswith("$argon2")
+
+        # Unknown usernames still run a hash verification
+        assert User.authenticate("ghost", "s3cret") is None
+        assert dummy_calls == [True]
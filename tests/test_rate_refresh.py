@@ -0,0 +1,159 @@
+"""Tests for exchange-rate refreshes started from the settings pages."""
+
+import contextvars
+import json
+from datetime import date
+from decimal import Decimal
+from unittest.mock import Mock, patch
+
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app import db
+from app.currency import PROVIDERS, _run_queued_refresh, currency_converter, rate_refresh_pending
+from app.models import ExchangeRate
+from tests.conftest import create_user, login
+
+
+class _FakeScheduler:
+    def __init__(self):
+        self.jobs = []
+
+    def add_job(self, **kwargs):
+        self.jobs.append(kwargs)
+
+
+def test_refresh_rates_is_queued_on_the_currency_scheduler(app, client):
+    app._currency_refresh_scheduler = scheduler = _FakeScheduler()
+
+    with patch("app.currency.requests.get") as get:
+        response = client.post("/refresh_rates")
+
+    assert response.status_code == 302
+    get.assert_not_called()
+    [job] = scheduler.jobs
+    assert job["func"] is _run_queued_refresh
+    assert job["id"] == "refresh_currency_rates_now"
+    assert job["args"] == (app, "EUR", None)
+
+
+def test_queued_refresh_uses_the_preferred_provider_order(app, rates):
+    create_user(app, username="bob", preferred_rate_provider="erapi_open")
+    client = login(app.test_client(), username="bob")
+    app._currency_refresh_scheduler = scheduler = _FakeScheduler()
+
+    client.post("/refresh_rates")
+
+    [job] = scheduler.jobs
+    assert job["args"][2] == ["erapi_open"] + [p for p in PROVIDERS if p != "erapi_open"]
+
+
+def test_changed_provider_preference_is_fetched_on_the_currency_scheduler(app, client):
+    app._currency_refresh_scheduler = scheduler = _FakeScheduler()
+
+    with patch("app.currency.requests.get") as get:
+        response = client.post("/general_settings", data={
+            "currency": "EUR", "timezone": "UTC", "preferred_rate_provider": "floatrates",
+            "theme_mode": "light", "accent_color": "purple", "date_format": "eu",
+        })
+
+    assert response.status_code == 302
+    get.assert_not_called()
+    [job] = scheduler.jobs
+    assert job["args"][2] == ["floatrates"] + [p for p in PROVIDERS if p != "floatrates"]
+
+
+def test_unavailable_preferred_provider_is_reported_after_the_queued_fetch(app, client):
+    app._currency_refresh_scheduler = scheduler = _FakeScheduler()
+    client.post("/general_settings", data={
+        "currency": "EUR", "timezone": "UTC", "preferred_rate_provider": "floatrates",
+        "theme_mode": "light", "accent_color": "purple", "date_format": "eu",
+    })
+    with app.app_context():
+        ExchangeRate.query.filter_by(provider="floatrates").delete()
+        db.session.commit()
+    ExchangeRate.clear_rates_cache()
+
+    # The failing fetches count against floatrates in the process-wide circuit breaker
+    with patch.dict(currency_converter._circuit_breaker), \
+            patch("app.currency.requests.get", side_effect=OSError("provider down")) as get:
+        pending = client.get("/general_settings").get_data(as_text=True)
+        get.assert_not_called()
+        [job] = scheduler.jobs
+        with patch("app.currency.refresh_exchange_rates"):
+            job["func"](*job["args"])
+        finished = client.get("/general_settings").get_data(as_text=True)
+        again = client.get("/general_settings").get_data(as_text=True)
+
+    assert "unavailable; using" not in pending
+    assert "unavailable; using" in finished
+    assert "unavailable; using" not in again
+
+
+def test_database_errors_do_not_trip_the_circuit_breaker(app, rates):
+    response = Mock(json=lambda: {"rates": {"USD": 1.1}})
+    with app.app_context():
+        with patch("app.currency.requests.get", return_value=response), \
+                patch.object(ExchangeRate, "save_rates", side_effect=OperationalError("INSERT", {}, Exception("locked"))):
+            currency_converter.set_priority(["frankfurter"])
+            fetched = currency_converter.get_exchange_rates("EUR", force_refresh=True)
+
+    assert fetched["USD"] == Decimal("1.1")
+    assert currency_converter.last_attempt_chain == [("frankfurter", "fetched")]
+    assert "frankfurter" not in currency_converter._circuit_breaker
+
+
+def test_lookups_serve_stored_rates_while_a_refresh_is_queued(app, client):
+    app._currency_refresh_scheduler = scheduler = _FakeScheduler()
+    client.post("/refresh_rates")
+    with app.app_context():
+        # Only older rates are stored, so a lookup would normally fetch today's
+        ExchangeRate.query.filter_by(date=date.today()).update({"date": date(2020, 1, 1)})
+        db.session.commit()
+    ExchangeRate.clear_rates_cache()
+
+    with patch("app.currency.requests.get") as get:
+        assert client.get("/general_settings").status_code == 200
+        assert client.get("/dashboard").status_code == 200
+    get.assert_not_called()
+
+    [job] = scheduler.jobs
+    with patch("app.currency.refresh_exchange_rates"):
+        job["func"](*job["args"])
+    assert not rate_refresh_pending(app)
+
+
+def test_save_rates_updates_the_row_a_concurrent_save_inserted(app):
+    real_commit = db.session.commit
+
+    def commit_after_another_insert():
+        # Another request saved the same provider's rates between our lookup and commit
+        with db.engine.begin() as connection:
+            connection.execute(ExchangeRate.__table__.insert().values(
+                date=date.today(), base_currency="EUR", provider="frankfurter", rates_json="{}"))
+        raise IntegrityError("INSERT INTO exchange_rate", {}, Exception("UNIQUE constraint failed"))
+
+    commits = iter([commit_after_another_insert, real_commit])
+    with app.app_context():
+        with patch.object(db.session, "commit", side_effect=lambda: next(commits)()):
+            ExchangeRate.save_rates({"EUR": "1", "USD": "1.2"}, "EUR", provider="frankfurter")
+
+        [row] = ExchangeRate.query.filter_by(provider="frankfurter").all()
+        assert json.loads(row.rates_json) == {"EUR": "1", "USD": "1.2"}
+
+
+def test_last_provider_is_tracked_per_context(app, rates):
+    def lookup(priority):
+        with app.app_context():
+            currency_converter.set_priority(priority)
+            currency_converter.get_exchange_rates("EUR")
+
+    def outcome():
+        return currency_converter.last_provider, currency_converter.last_attempt_chain
+
+    # Two requests (threads or greenlets), each with its own context
+    mine, other = contextvars.copy_context(), contextvars.copy_context()
+    mine.run(lookup, ["floatrates"])
+    other.run(lookup, ["erapi_open"])
+
+    assert mine.run(outcome) == ("floatrates", [("floatrates", "cache")])
+    assert other.run(outcome) == ("erapi_open", [("erapi_open", "cache")])
@@ -0,0 +1,48 @@
+"""Tests for the memoized url_for used by templates."""
+
+import pytest
+from flask import render_template_string
+from werkzeug.routing import BuildError
+
+
+@pytest.fixture()
+def render(app):
+    def render(source, path="/dashboard", **request_kwargs):
+        with app.test_request_context(path, **request_kwargs):
+            return render_template_string(source)
+    return render
+
+
+def test_query_arguments_are_part_of_the_link(render):
+    assert render("{{ url_for('main.dashboard', sort='name') }}") == "/dashboard?sort=name"
+    assert render("{{ url_for('main.dashboard', sort='cost') }}") == "/dashboard?sort=cost"
+    assert render("{{ url_for('main.dashboard') }}") == "/dashboard"
+
+
+def test_path_arguments_are_part_of_the_link(render):
+    assert render("{{ url_for('main.edit_subscription', id=1) }}") == "/edit_subscription/1"
+    assert render("{{ url_for('main.edit_subscription', id=2) }}") == "/edit_subscription/2"
+
+
+def test_external_links_follow_the_request_host(render):
+    source = "{{ url_for('main.dashboard', _external=True) }}"
+
+    assert render(source, base_url="http://tracker.example.com") == "http://tracker.example.com/dashboard"
+    assert render(source, base_url="https://other.example.org") == "https://other.example.org/dashboard"
+
+
+def test_links_follow_the_mount_point(render):
+    source = "{{ url_for('main.dashboard') }}"
+
+    assert render(source) == "/dashboard"
+    assert render(source, base_url="http://localhost/tracker") == "/tracker/dashboard"
+    assert render(source) == "/dashboard"
+
+
+def test_blueprint_relative_endpoints_resolve_per_request(render):
+    source = "{{ url_for('.login') }}"
+
+    assert render(source, path="/login") == "/login"
+    with pytest.raises(BuildError):
+        # '.login' means main.login inside the main blueprint, which doesn't exist
+        render(source, path="/dashboard")